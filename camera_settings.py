@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+Camera capture settings shared by the ANPR scripts and dashboards
+"""
+
+import sys
+
+import cv2
+
+# Native capture backend - DirectShow on Windows, V4L2 on Linux, OpenCV's choice elsewhere
+CAMERA_BACKEND = cv2.CAP_DSHOW if sys.platform == 'win32' else cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
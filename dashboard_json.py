@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+JSON encoding shared by the Shobha dashboards
+Uses orjson when it is installed, Flask's default provider otherwise
+"""
+
+from flask.json.provider import DefaultJSONProvider  # pyright: ignore[reportMissingImports]
+
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson - types orjson can't handle fall back to Flask's defaults"""
+    
+    def dumps(self, obj, **kwargs):
+        # Datetimes go through Flask's default (HTTP date, read as UTC) so output matches the fallback
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME,
+                            default=self.default).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def configure_json(app):
+    """Install the fastest available JSON provider on a Flask app"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        # JSON is read by the dashboard script - skip key sorting and debug-mode indentation
+        app.json.sort_keys = False
+        app.json.compact = True
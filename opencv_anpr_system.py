@@ -12,6 +12,13 @@ from datetime import datetime
 import os
 import sys
 
+from camera_settings import CAMERA_BACKEND
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
 class OpenCVANPRSystem:
     def __init__(self):
         # Camera configuration
@@ -19,32 +26,48 @@ class OpenCVANPRSystem:
         self.camera = None
         self.running = False
         
+        # Headless (server) mode - no overlays or preview window, stop with Ctrl+C
+        self.headless = os.getenv('ANPR_HEADLESS', '0') == '1'
+        
         # Detection settings
         self.detection_interval = 3.0  # 3 seconds between detections
         self.last_detection_time = 0
         self.min_plate_area = 500  # Much smaller minimum area
         self.max_plate_area = 100000  # Larger maximum area
+        self.detection_scale = 0.5  # Plate search runs on a downscaled frame
+        
+        # Preprocessing objects reused on every frame
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        self.sharpen_kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+        self.morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        self.plate_morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+        
+        # Tesseract configs for better number plate recognition
+        self.ocr_configs = [
+            f'--oem 3 --psm {psm} -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+            for psm in (8, 7, 6, 13)
+        ]
         
-        # Indian license plate patterns (comprehensive)
-        self.plate_patterns = [
+        # Indian license plate patterns (comprehensive), joined into one compiled alternation
+        # Standard, commercial, two wheeler and temporary plates share the KA01AB1234 format
+        self.plate_pattern = re.compile('|'.join([
             # Standard format: KA01AB1234
             r'^[A-Z]{2}[0-9]{2}[A-Z]{2}[0-9]{4}$',
             # BH format: BH01ABC123
             r'^[A-Z]{2}[0-9]{2}[A-Z]{1,3}[0-9]{3,4}$',
             # New format: 22BHX1234
             r'^[0-9]{2}[A-Z]{2}[A-Z]{1}[0-9]{4}$',
-            # Commercial: KA01AB1234
-            r'^[A-Z]{2}[0-9]{2}[A-Z]{2}[0-9]{4}$',
-            # Two wheeler: KA01AB1234
-            r'^[A-Z]{2}[0-9]{2}[A-Z]{2}[0-9]{4}$',
-            # Temporary: KA01AB1234
-            r'^[A-Z]{2}[0-9]{2}[A-Z]{2}[0-9]{4}$',
-        ]
+        ]))
+        self.non_alnum_pattern = re.compile(r'[^A-Z0-9]')
         
         # State codes for validation
-        self.state_codes = [
+        self.state_codes = {
             'AP', 'AR', 'AS', 'BR', 'CG', 'GA', 'GJ', 'HR', 'HP', 'JK', 'JH', 'KA', 'KL', 'MP', 'MH', 'MN', 'ML', 'MZ', 'NL', 'OD', 'PB', 'RJ', 'SK', 'TN', 'TG', 'TR', 'UP', 'UT', 'WB', 'AN', 'CH', 'DN', 'DD', 'DL', 'LD', 'PY', 'BH'
-        ]
+        }
+        
+        # Results of the last scan, reused for the debug overlay on every frame
+        self.last_contours = []
+        self.last_candidates = []
         
         # Detection history
         self.detection_history = []
@@ -54,6 +77,8 @@ class OpenCVANPRSystem:
         print("=" * 60)
         print("Advanced license plate detection for Indian vehicles")
         print("Supports all Indian license plate formats")
+        if pytesseract is None:
+            print("⚠️ Tesseract not available - plate text will not be read")
         print("=" * 60)
     
     def initialize_camera(self):
@@ -62,7 +87,7 @@ class OpenCVANPRSystem:
         
         # Try different camera indices
         for i in range(3):
-            self.camera = cv2.VideoCapture(i)
+            self.camera = cv2.VideoCapture(i, CAMERA_BACKEND)
             if self.camera.isOpened():
                 print(f"✅ Camera {i} opened successfully")
                 self.camera_index = i
@@ -74,26 +99,35 @@ class OpenCVANPRSystem:
             print("❌ No camera available")
             return False
         
+        self.configure_camera()
+        print("✅ Camera configured successfully")
+        return True
+    
+    def configure_camera(self):
+        """Apply capture settings to the open camera (on start and after switching cameras)"""
         # Set camera properties for optimal performance
+        # MJPG lets USB cameras deliver 720p at full frame rate
+        self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
         self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
         self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         self.camera.set(cv2.CAP_PROP_FPS, 30)
+        self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Read the newest frame, not a driver backlog
         self.camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)
         self.camera.set(cv2.CAP_PROP_BRIGHTNESS, 0.5)
         self.camera.set(cv2.CAP_PROP_CONTRAST, 0.5)
         self.camera.set(cv2.CAP_PROP_SATURATION, 0.5)
-        
-        print("✅ Camera configured successfully")
-        return True
     
     def preprocess_image(self, image):
         """Advanced image preprocessing for better detection"""
+        # Downscale - plates big enough to read survive it, and the bilateral filter is the costliest step
+        small = cv2.resize(image, (0, 0), fx=self.detection_scale, fy=self.detection_scale,
+                           interpolation=cv2.INTER_AREA)
+        
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
         
         # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
+        enhanced = self.clahe.apply(gray)
         
         # Apply bilateral filter to reduce noise while preserving edges
         filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
@@ -102,21 +136,16 @@ class OpenCVANPRSystem:
         blurred = cv2.GaussianBlur(filtered, (5, 5), 0)
         
         # Apply sharpening
-        kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(blurred, -1, kernel)
+        sharpened = cv2.filter2D(blurred, -1, self.sharpen_kernel)
         
         return sharpened
     
     def detect_edges(self, image):
         """Advanced edge detection with multiple methods"""
-        # Method 1: Canny with different thresholds
-        edges1 = cv2.Canny(image, 30, 100)
-        edges2 = cv2.Canny(image, 50, 150)
-        edges3 = cv2.Canny(image, 100, 200)
-        
-        # Combine different Canny results
-        combined_canny = cv2.bitwise_or(edges1, edges2)
-        combined_canny = cv2.bitwise_or(combined_canny, edges3)
+        # Method 1: Canny
+        # The union of Canny (30,100), (50,150) and (100,200) equals Canny (30,100):
+        # both thresholds are the lowest, so its hysteresis keeps every edge the others do
+        combined_canny = cv2.Canny(image, 30, 100)
         
         # Method 2: Sobel edge detection
         sobelx = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
@@ -128,63 +157,59 @@ class OpenCVANPRSystem:
         final_edges = cv2.bitwise_or(combined_canny, sobel_edges)
         
         # Apply morphological operations to connect broken edges
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        final_edges = cv2.morphologyEx(final_edges, cv2.MORPH_CLOSE, kernel)
+        final_edges = cv2.morphologyEx(final_edges, cv2.MORPH_CLOSE, self.morph_kernel)
         
         return final_edges
     
-    def find_contours(self, edges):
-        """Find and filter contours for license plates with strict criteria"""
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def find_contours(self, contours):
+        """Filter contours for license plates with strict criteria"""
+        if not contours:
+            return []
         
-        plate_candidates = []
+        # Edges come from the downscaled frame - measure in full-resolution coordinates
+        scale = 1 / self.detection_scale
+        areas = np.array([cv2.contourArea(c) for c in contours]) * scale * scale
+        rects = (np.array([cv2.boundingRect(c) for c in contours]) * scale).astype(int)
+        aspect_ratios = rects[:, 2] / np.maximum(rects[:, 3], 1)
+        
+        # Area (license plates are typically 1000-50000 pixels), aspect ratio
+        # (typically between 2.0 and 4.0) and minimum size, in one pass
+        keep = np.flatnonzero(
+            (areas >= 1000) & (areas <= 50000) &
+            (aspect_ratios >= 2.0) & (aspect_ratios <= 4.0) &
+            (rects[:, 2] >= 50) & (rects[:, 3] >= 15)
+        )
+        if keep.size == 0:
+            return []
         
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            
-            # Filter by area (license plates are typically 1000-50000 pixels)
-            if area < 1000 or area > 50000:
-                continue
-                
-            # Get bounding rectangle
-            x, y, w, h = cv2.boundingRect(contour)
-            aspect_ratio = w / h
-            
-            # License plates typically have aspect ratio between 2.0 and 4.0
-            if not (2.0 <= aspect_ratio <= 4.0):
-                continue
-                
-            # Check if contour is roughly rectangular
-            hull = cv2.convexHull(contour)
-            hull_area = cv2.contourArea(hull)
-            solidity = area / hull_area if hull_area > 0 else 0
-            
-            # Should be fairly solid (rectangular)
-            if solidity < 0.8:
-                continue
-                
-            # Check extent (how much of the bounding rectangle is filled)
-            extent = area / (w * h)
-            if extent < 0.6:
-                continue
-                
-            # Check if the contour is not too elongated
-            if w < 50 or h < 15:
-                continue
-                
+        # Check if contour is roughly rectangular - hulls only for the survivors
+        hull_areas = np.array([cv2.contourArea(cv2.convexHull(contours[i])) for i in keep]) * scale * scale
+        solidities = np.divide(areas[keep], hull_areas, out=np.zeros(keep.size), where=hull_areas > 0)
+        
+        # Check extent (how much of the bounding rectangle is filled)
+        extents = areas[keep] / (rects[keep, 2] * rects[keep, 3])
+        
+        # Should be fairly solid (rectangular) and mostly filled
+        good = (solidities >= 0.8) & (extents >= 0.6)
+        keep, solidities, extents = keep[good], solidities[good], extents[good]
+        
+        # Sort by area (largest first) and return top 5 candidates
+        top = np.argsort(areas[keep])[::-1][:5]
+        
+        plate_candidates = []
+        for j in top:
+            i = keep[j]
+            x, y, w, h = (int(v) for v in rects[i])
             plate_candidates.append({
-                'contour': contour,
-                'area': area,
-                'aspect_ratio': aspect_ratio,
-                'solidity': solidity,
-                'extent': extent,
+                'contour': (contours[i] * scale).astype(np.int32),
+                'area': float(areas[i]),
+                'aspect_ratio': float(aspect_ratios[i]),
+                'solidity': float(solidities[j]),
+                'extent': float(extents[j]),
                 'bbox': (x, y, w, h)
             })
         
-        # Sort by area (largest first)
-        plate_candidates.sort(key=lambda x: x['area'], reverse=True)
-        
-        return plate_candidates[:5]  # Return top 5 candidates
+        return plate_candidates
     
     def extract_plate_region(self, image, bbox):
         """Extract and enhance license plate region"""
@@ -213,26 +238,18 @@ class OpenCVANPRSystem:
         thresh = cv2.adaptiveThreshold(gray_plate, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
         
         # Apply morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, self.plate_morph_kernel)
         
         return thresh
     
     def extract_text_ocr(self, plate_image):
         """Extract text using Tesseract OCR with multiple methods"""
+        if pytesseract is None:
+            return None
+        
         try:
-            import pytesseract
-            
-            # Configure Tesseract for better number plate recognition
-            configs = [
-                '--oem 3 --psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--oem 3 --psm 13 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-            ]
-            
             texts = []
-            for config in configs:
+            for config in self.ocr_configs:
                 try:
                     text = pytesseract.image_to_string(plate_image, config=config)
                     if text and text.strip():
@@ -244,7 +261,7 @@ class OpenCVANPRSystem:
             valid_texts = []
             for text in texts:
                 # Clean text (remove non-alphanumeric characters)
-                cleaned = re.sub(r'[^A-Z0-9]', '', text)
+                cleaned = self.non_alnum_pattern.sub('', text)
                 
                 # Check if it looks like a license plate
                 if self.validate_indian_plate(cleaned):
@@ -254,8 +271,6 @@ class OpenCVANPRSystem:
             if valid_texts:
                 return max(set(valid_texts), key=valid_texts.count)
                 
-        except ImportError:
-            print("⚠️ Tesseract not available, using simulation")
         except Exception as e:
             print(f"⚠️ OCR error: {e}")
             
@@ -267,16 +282,15 @@ class OpenCVANPRSystem:
             return False
         
         # Clean text
-        text = re.sub(r'[^A-Z0-9]', '', text.upper())
+        text = self.non_alnum_pattern.sub('', text.upper())
         
         # Check length
         if len(text) < 8 or len(text) > 12:
             return False
         
         # Check patterns
-        for pattern in self.plate_patterns:
-            if re.match(pattern, text):
-                return True
+        if self.plate_pattern.match(text):
+            return True
         
         # Additional validation for state codes
         if len(text) >= 4:
@@ -329,8 +343,13 @@ class OpenCVANPRSystem:
         # Detect edges
         edges = self.detect_edges(processed)
         
-        # Find contours
-        candidates = self.find_contours(edges)
+        # Find outer contours once - plates are outer boundaries, so no hierarchy is needed
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+        candidates = self.find_contours(contours)
+        
+        # Keep this scan's contours for the debug overlay until the next scan
+        self.last_contours = [(c / self.detection_scale).astype(np.int32) for c in contours]
+        self.last_candidates = candidates
         
         print(f"📊 Found {len(candidates)} potential candidates")
         
@@ -397,22 +416,12 @@ class OpenCVANPRSystem:
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
     
     def draw_all_contours(self, frame):
-        """Draw all contours for debugging"""
-        # Preprocess image
-        processed = self.preprocess_image(frame)
-        
-        # Detect edges
-        edges = self.detect_edges(processed)
-        
-        # Find ALL contours
-        contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        
+        """Draw all contours from the last scan for debugging"""
         # Draw all contours in blue
-        cv2.drawContours(frame, contours, -1, (255, 0, 0), 1)
+        cv2.drawContours(frame, self.last_contours, -1, (255, 0, 0), 1)
         
         # Draw filtered candidates in green
-        candidates = self.find_contours(edges)
-        for candidate in candidates:
+        for candidate in self.last_candidates:
             x, y, w, h = candidate['bbox']
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
             cv2.putText(frame, f"A:{candidate['area']:.0f}", (x, y-5), 
@@ -467,6 +476,8 @@ class OpenCVANPRSystem:
             return
         
         print("✅ System ready")
+        if self.headless:
+            print("🖥️ Headless mode - no preview window, press Ctrl+C to stop")
         print("Controls:")
         print("  'q' - Quit")
         print("  's' - Save current frame")
@@ -498,6 +509,12 @@ class OpenCVANPRSystem:
                 # Detect license plates
                 detections = self.detect_license_plates(frame)
                 
+                if self.headless:
+                    # Save ONLY ONE detection per cycle - nothing else to render
+                    if detections:
+                        self.save_detection(detections[0], frame)
+                    continue
+                
                 # Draw all contours for debugging
                 self.draw_all_contours(frame)
                 
@@ -529,10 +546,11 @@ class OpenCVANPRSystem:
                     # Change camera
                     self.camera.release()
                     self.camera_index = 1 if self.camera_index == 0 else 0
-                    self.camera = cv2.VideoCapture(self.camera_index)
+                    self.camera = cv2.VideoCapture(self.camera_index, CAMERA_BACKEND)
                     if not self.camera.isOpened():
                         print(f"❌ Could not open camera {self.camera_index}")
                         break
+                    self.configure_camera()
                     print(f"📹 Switched to camera {self.camera_index}")
                 elif key == ord('h'):
                     # Show detection history
@@ -549,14 +567,16 @@ class OpenCVANPRSystem:
             # Cleanup
             if self.camera:
                 self.camera.release()
-            cv2.destroyAllWindows()
+            if not self.headless:
+                cv2.destroyAllWindows()
             print("✅ ANPR System stopped")
     
     def cleanup(self):
         """Cleanup resources"""
         if self.camera:
             self.camera.release()
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
 
 def main():
     print("🚗 OpenCV ANPR System - Comprehensive Version")
@@ -5,7 +5,6 @@ High accuracy number plate recognition using Plate Recognizer API
 """
 
 import requests
-import base64
 import cv2
 import numpy as np
 from datetime import datetime
@@ -26,6 +25,10 @@ class PlateRecognizerAPI:
         self.headers = {
             "Authorization": f"Token {self.api_key}"
         }
+        
+        # Keep-alive session - reuses the TLS connection across API calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
     
     def detect_plates(self, image):
         """
@@ -38,21 +41,15 @@ class PlateRecognizerAPI:
             List of detected plates with confidence scores
         """
         try:
-            # Convert image to base64
+            # Upload raw JPEG bytes as multipart (no base64 inflation)
             _, buffer = cv2.imencode('.jpg', image)
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Prepare request data
-            data = {
-                'image': image_base64,
-                'regions': ['in'],  # Focus on Indian plates
-                'config': '{"region": {"type": "polygon", "vertices": [[0, 0], [image_width, 0], [image_width, image_height], [0, image_height]]}}'
-            }
+            files = {'upload': ('image.jpg', buffer.tobytes(), 'image/jpeg')}
+            data = {'regions': 'in'}  # Focus on Indian plates
             
             # Make API request
-            response = requests.post(
+            response = self.session.post(
                 self.base_url,
-                headers=self.headers,
+                files=files,
                 data=data,
                 timeout=10
             )
@@ -60,13 +57,14 @@ class PlateRecognizerAPI:
             if response.status_code == 200:
                 result = response.json()
                 plates = []
+                now = datetime.now()  # One timestamp for every plate in this response
                 
                 for detection in result.get('results', []):
                     plate_info = {
                         'text': detection.get('plate', '').upper(),
                         'confidence': detection.get('score', 0.0),
                         'bbox': detection.get('box', {}),
-                        'timestamp': datetime.now(),
+                        'timestamp': now,
                         'region': detection.get('region', {}),
                         'vehicle_type': detection.get('vehicle', {}).get('type', 'unknown')
                     }
@@ -121,6 +119,7 @@ if __name__ == "__main__":
     # Test with camera
     print("\n🔍 Testing with camera...")
     cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Read the newest frame, not a driver backlog
     
     if cap.isOpened():
         print("✅ Camera opened - show a number plate")
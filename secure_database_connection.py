@@ -6,6 +6,7 @@ import psycopg2.extras
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import os
+import re
 from dotenv import load_dotenv
 import logging
 from pathlib import Path
@@ -39,6 +40,11 @@ class SecureDatabaseConnection:
             'shobha_permanent_parking_sessions'
         ]
         
+        # Tables the ANPR gate may UPDATE in read-only mode - it opens and closes parking sessions
+        self.session_write_tables = [
+            'shobha_permanent_parking_sessions'
+        ]
+        
         self.connection = None
         self.setup_logging()
         self.connect()
@@ -100,10 +106,10 @@ class SecureDatabaseConnection:
         # Allow simple queries that don't reference tables (like SELECT 1)
         has_table_reference = any(keyword in query_upper for keyword in ['FROM', 'JOIN', 'UPDATE', 'INSERT', 'DELETE'])
         if has_table_reference:
-            has_allowed_table = any(table in query_upper for table in self.allowed_tables)
+            has_allowed_table = any(table.upper() in query_upper for table in self.allowed_tables)
             if not has_allowed_table:
                 # Allow COUNT queries for statistics
-                if 'COUNT(' in query_upper and any(table in query_upper for table in self.allowed_tables):
+                if 'COUNT(' in query_upper and any(table.upper() in query_upper for table in self.allowed_tables):
                     self.logger.info(f"Allowing COUNT query for statistics: {query}")
                     return True
                 self.logger.warning(f"No allowed tables in query: {query}")
@@ -125,6 +131,15 @@ class SecureDatabaseConnection:
         
         return True
     
+    def is_update_blocked(self, query: str) -> bool:
+        """Read-only mode blocks UPDATE statements, except on the session write tables"""
+        if not self.read_only_mode:
+            return False
+        
+        # Tables named after UPDATE (ignores columns like updated_at and row locks like FOR UPDATE)
+        targets = re.findall(r'\bUPDATE\s+(\w+)', query.upper())
+        return any(table.lower() not in self.session_write_tables for table in targets)
+    
     def get_cursor(self):
         """Get database cursor"""
         if self.connection:
@@ -176,7 +191,7 @@ class SecureDatabaseConnection:
                 return False
             
             # Additional check for read-only mode
-            if self.read_only_mode and 'UPDATE' in query.upper():
+            if self.is_update_blocked(query):
                 self.logger.warning(f"UPDATE blocked in read-only mode: {query}")
                 return False
             
@@ -195,6 +210,38 @@ class SecureDatabaseConnection:
             self.logger.error(f"Update execution error: {e}")
             return False
     
+    def execute_update_returning(self, query: str, params: tuple = None) -> Optional[Dict]:
+        """Execute INSERT/UPDATE ... RETURNING query and return the first returned row.
+        
+        Returns {} when the statement ran but matched no rows, None when it was blocked or failed.
+        """
+        try:
+            # Validate query
+            if not self.validate_query(query):
+                self.logger.error(f"Update query validation failed: {query}")
+                return None
+            
+            # Additional check for read-only mode
+            if self.is_update_blocked(query):
+                self.logger.warning(f"UPDATE blocked in read-only mode: {query}")
+                return None
+            
+            cursor = self.get_cursor()
+            if not cursor:
+                return None
+            
+            cursor.execute(query, params)
+            result = cursor.fetchone()
+            self.connection.commit()
+            cursor.close()
+            
+            # Log successful update
+            self.logger.info(f"Update executed successfully: {query[:100]}...")
+            return dict(result) if result else {}
+        except Exception as e:
+            self.logger.error(f"Update execution error: {e}")
+            return None
+    
     def check_permanent_parking(self, vehicle_number: str) -> Optional[Dict]:
         """Check if vehicle has permanent parking access (READ-ONLY)"""
         query = """
@@ -237,37 +284,27 @@ class SecureDatabaseConnection:
     
     def update_session_exit(self, session_id: str) -> bool:
         """Update session with exit time, calculate fees, and mark as completed (UPDATE only)"""
-        # First get the session details
-        get_query = """
-            SELECT entry_time, base_fee FROM booking_sessions 
-            WHERE id = %s
-        """
-        results = self.execute_query(get_query, (session_id,))
-        
-        if not results:
-            return False
-        
-        session = results[0]
-        entry_time = session['entry_time']
-        base_fee = session['base_fee']
-        exit_time = datetime.now()
-        
-        # Calculate duration and total fee
-        duration = exit_time - entry_time
-        duration_minutes = int(duration.total_seconds() / 60)
-        
-        # Calculate total fee (base_fee + hourly rate)
+        # Duration and total fee (base_fee + hourly rate) are computed from the row in the same statement
         per_hour_fee = 10  # From your schema
-        hours = duration_minutes / 60
-        total_fee = base_fee + int(hours * per_hour_fee)
-        
-        # Update the session
-        update_query = """
+        query = """
             UPDATE booking_sessions 
-            SET exit_time = %s, duration_minutes = %s, total_fee = %s, status = 'completed'
+            SET exit_time = %s,
+                duration_minutes = FLOOR(EXTRACT(EPOCH FROM (%s - entry_time)) / 60),
+                total_fee = base_fee + FLOOR(FLOOR(EXTRACT(EPOCH FROM (%s - entry_time)) / 60) / 60 * %s),
+                status = 'completed'
             WHERE id = %s
+            RETURNING id
         """
-        return self.execute_update(update_query, (exit_time, duration_minutes, total_fee, session_id))
+        exit_time = datetime.now()
+        result = self.execute_update_returning(query, (exit_time, exit_time, exit_time, per_hour_fee, session_id))
+        if result is None:
+            # booking_sessions is not an allowed table - the security checks reject this write
+            self.logger.error(f"Session exit for {session_id} was blocked or failed - see the warnings above")
+            return False
+        if not result:
+            self.logger.warning(f"No session {session_id} to close")
+            return False
+        return True
     
     def get_active_sessions(self) -> List[Dict]:
         """Get all active parking sessions (READ-ONLY)"""
@@ -306,39 +343,78 @@ class SecureDatabaseConnection:
         return self.execute_update(query, (permanent_parking_id, now))
     
     def update_permanent_session_exit(self, permanent_parking_id: str) -> bool:
-        """Update permanent parking session with exit time (UPDATE only)"""
+        """Update latest active permanent parking session with exit time (UPDATE only)"""
         query = """
             UPDATE shobha_permanent_parking_sessions 
-            SET exit_time = %s, duration_minutes = EXTRACT(EPOCH FROM (%s - entry_time))/60
-            WHERE permanent_parking_id = %s AND exit_time IS NULL
+            SET exit_time = %s, duration_minutes = EXTRACT(EPOCH FROM (%s - entry_time))/60, updated_at = %s
+            WHERE id = (
+                SELECT id FROM shobha_permanent_parking_sessions
+                WHERE permanent_parking_id = %s AND exit_time IS NULL
+                ORDER BY entry_time DESC LIMIT 1
+            )
+            RETURNING id
+        """
+        now = datetime.now()
+        result = self.execute_update_returning(query, (now, now, now, permanent_parking_id))
+        if result is None:
+            self.logger.error(f"Session exit for permanent parking {permanent_parking_id} was blocked or failed - see the warnings above")
+            return False
+        if not result:
+            self.logger.warning(f"No active session to close for permanent parking {permanent_parking_id}")
+            return False
+        return True
+    
+    def record_permanent_movement(self, permanent_parking_id: str) -> Optional[str]:
+        """Close the active permanent parking session (exit) or open a new one (entry) in one statement.
+        
+        Returns 'entry', 'exit', or None if the write was blocked or failed.
+        """
+        query = """
+            WITH active AS (
+                SELECT id FROM shobha_permanent_parking_sessions
+                WHERE permanent_parking_id = %s AND exit_time IS NULL
+                ORDER BY entry_time DESC LIMIT 1
+                FOR UPDATE
+            ),
+            closed AS (
+                UPDATE shobha_permanent_parking_sessions
+                SET exit_time = %s, duration_minutes = EXTRACT(EPOCH FROM (%s - entry_time))/60, updated_at = %s
+                WHERE id = (SELECT id FROM active)
+                RETURNING 'exit' AS action
+            ),
+            opened AS (
+                INSERT INTO shobha_permanent_parking_sessions
+                (permanent_parking_id, entry_time)
+                SELECT %s, %s
+                WHERE NOT EXISTS (SELECT 1 FROM active)
+                RETURNING 'entry' AS action
+            )
+            SELECT action FROM closed UNION ALL SELECT action FROM opened
         """
         now = datetime.now()
-        return self.execute_update(query, (now, now, permanent_parking_id))
+        result = self.execute_update_returning(query, (permanent_parking_id, now, now, now, permanent_parking_id, now))
+        if not result:
+            self.logger.error(f"Entry/exit for permanent parking {permanent_parking_id} was blocked or failed - see the warnings above")
+            return None
+        return result['action']
     
     def get_system_stats(self) -> Dict[str, int]:
         """Get system statistics (READ-ONLY)"""
         stats = {}
         
         try:
-            # Total sessions (using shobha_permanent_parking_sessions)
-            total_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions"
-            total_result = self.execute_query(total_query)
-            stats['total_sessions'] = total_result[0]['count'] if total_result else 0
-            
-            # Active sessions (sessions without exit_time)
-            active_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions WHERE exit_time IS NULL"
-            active_result = self.execute_query(active_query)
-            stats['active_sessions'] = active_result[0]['count'] if active_result else 0
-            
-            # Completed sessions (sessions with exit_time)
-            completed_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions WHERE exit_time IS NOT NULL"
-            completed_result = self.execute_query(completed_query)
-            stats['completed_sessions'] = completed_result[0]['count'] if completed_result else 0
-            
-            # Permanent vehicles
-            permanent_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking"
-            permanent_result = self.execute_query(permanent_query)
-            stats['permanent_vehicles'] = permanent_result[0]['count'] if permanent_result else 0
+            # Session counts and permanent vehicles in one round-trip
+            stats_query = """
+                SELECT
+                    COUNT(*) AS total_sessions,
+                    COUNT(*) FILTER (WHERE exit_time IS NULL) AS active_sessions,
+                    COUNT(*) FILTER (WHERE exit_time IS NOT NULL) AS completed_sessions,
+                    (SELECT COUNT(*) FROM shobha_permanent_parking) AS permanent_vehicles
+                FROM shobha_permanent_parking_sessions
+            """
+            result = self.execute_query(stats_query, fetch_one=True)
+            for key in ('total_sessions', 'active_sessions', 'completed_sessions', 'permanent_vehicles'):
+                stats[key] = result[key] if result else 0
             
         except Exception as e:
             self.logger.error(f"Error getting stats: {e}")
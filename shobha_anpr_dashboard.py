@@ -10,6 +10,8 @@ from flask_cors import CORS  # pyright: ignore[reportMissingModuleSource]
 import cv2  # pyright: ignore[reportMissingImports]
 import numpy as np  # pyright: ignore[reportMissingImports]
 import threading
+import hashlib
+from collections import OrderedDict, deque
 import time
 import base64
 from datetime import datetime
@@ -17,10 +19,35 @@ import os
 from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
 import logging
 
+from camera_settings import CAMERA_BACKEND
+from dashboard_json import configure_json
+
+try:
+    import pytesseract  # pyright: ignore[reportMissingImports]
+except ImportError:
+    pytesseract = None
+
+try:
+    from turbojpeg import TurboJPEG  # pyright: ignore[reportMissingImports]
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG or the libturbojpeg shared library is missing - use cv2.imencode
+    turbo_jpeg = None
+
 # Load environment variables
 load_dotenv()
 
+# Tesseract setup - path for Windows, single-line page segmentation for plates
+TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+OCR_CONFIG = '--psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+if pytesseract is not None:
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
 app = Flask(__name__)
+configure_json(app)
 CORS(app)
 
 # Configure logging
@@ -31,9 +58,44 @@ class ShobhaANPRSystem:
     def __init__(self):
         self.camera = None
         self.running = False
-        self.detected_plates = []
+        self.detected_plates = OrderedDict()  # plate text -> (monotonic time seen, plate info), oldest first
         self.last_detection_time = 0
         self.detection_interval = 2.0  # 2 seconds between detections
+        self.detection_scale = 0.5  # Contour search runs on a uniformly downscaled frame
+        self.min_plate_area = 200  # Plate area limits in full-resolution pixels
+        self.max_plate_area = 200000
+        
+        # Preprocessing objects reused on every frame
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+        self.sharpen_kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]], dtype=np.float32)
+        self.morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        
+        # OCR results keyed by plate-region hash (oldest evicted first)
+        self.ocr_cache = OrderedDict()  # region hash -> (monotonic time stored, plate text)
+        self.ocr_cache_size = 256
+        self.ocr_cache_ttl = 10  # seconds - a new car at the same spot must get a fresh read
+        
+        # Dashboard stats cache (seconds)
+        self.stats_cache = None
+        self.stats_cache_time = 0
+        self.stats_cache_ttl = float(os.getenv('STATS_CACHE_TTL', '10'))
+        
+        # Latest JPEG-encoded frame shared by all live feed viewers
+        self.latest_jpeg = None
+        self.jpeg_condition = threading.Condition()
+        self.live_viewers = 0
+        
+        # Detected plates revision (bumped on every change) and recent new-plate
+        # events for /api/plate_stream listeners
+        self.plates_revision = 0
+        self.plates_epoch = os.urandom(4).hex()  # Per-process ETag prefix - revisions restart at 0
+        self.plate_events = deque(maxlen=50)
+        self.plate_condition = threading.Condition()
+        
+        # Registered vehicles keyed by plate number (refreshed in the background)
+        self.plate_map = {}
+        self.plate_map_refresh_interval = 60  # seconds
+        self.plate_map_stop = threading.Event()  # Wakes the refresh thread on shutdown
         
         # Database connection (Shobha tables only)
         try:
@@ -46,6 +108,12 @@ class ShobhaANPRSystem:
             self.db_available = False
             logger.warning("⚠️ Database not available - running in demo mode")
         
+        # Load registered vehicles and keep them fresh
+        if self.db_available:
+            self.refresh_plate_map()
+            self.plate_map_thread = threading.Thread(target=self.plate_map_loop, daemon=True)
+            self.plate_map_thread.start()
+        
         # Initialize camera
         self.init_camera()
         
@@ -56,15 +124,17 @@ class ShobhaANPRSystem:
     def init_camera(self):
         """Initialize camera for live feed"""
         try:
-            self.camera = cv2.VideoCapture(0)
+            self.camera = cv2.VideoCapture(0, CAMERA_BACKEND)
             if not self.camera.isOpened():
                 logger.error("❌ Could not open camera")
                 return False
             
-            # Set camera properties
+            # Set camera properties (MJPG before the size, or YUYV caps the frame rate)
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
             self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
             self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             self.camera.set(cv2.CAP_PROP_FPS, 30)
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Read the newest frame after idle periods
             
             logger.info("✅ Camera initialized successfully")
             return True
@@ -75,12 +145,18 @@ class ShobhaANPRSystem:
     def detect_license_plates(self, frame):
         """Enhanced license plate detection for Shobha vehicles"""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Convert to grayscale once - plate ROIs for OCR are sliced from this buffer
+            full_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            
+            # Downscale for contour search - plate-sized regions survive half resolution
+            # One factor for both axes keeps contour aspect ratios true for any frame shape
+            gray = cv2.resize(full_gray, (0, 0), fx=self.detection_scale, fy=self.detection_scale,
+                              interpolation=cv2.INTER_AREA)
+            scale = 1 / self.detection_scale
+            area_scale = self.detection_scale ** 2  # Full-resolution areas -> downscaled areas
             
             # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(gray)
+            enhanced = self.clahe.apply(gray)
             
             # Apply bilateral filter to reduce noise
             filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
@@ -89,76 +165,88 @@ class ShobhaANPRSystem:
             blurred = cv2.GaussianBlur(filtered, (5, 5), 0)
             
             # Apply sharpening filter
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(blurred, -1, kernel)
-            
-            # Multiple edge detection methods
-            # Canny with adaptive thresholds
-            edges1 = cv2.Canny(sharpened, 50, 150)
-            edges2 = cv2.Canny(sharpened, 100, 200)
-            edges3 = cv2.Canny(sharpened, 30, 100)
+            sharpened = cv2.filter2D(blurred, -1, self.sharpen_kernel)
             
-            # Combine edge detection results
-            combined_edges = cv2.bitwise_or(edges1, edges2)
-            combined_edges = cv2.bitwise_or(combined_edges, edges3)
+            # Edge detection
+            # The union of Canny (50,150), (100,200) and (30,100) equals Canny (30,100):
+            # both thresholds are the lowest, so its hysteresis keeps every edge the others do
+            edges = cv2.Canny(sharpened, 30, 100)
             
             # Morphological operations to connect broken edges
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-            morphed = cv2.morphologyEx(combined_edges, cv2.MORPH_CLOSE, kernel)
+            morphed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, self.morph_kernel)
             
             # Find contours
             contours, _ = cv2.findContours(morphed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             # Debug: Log contour count
-            logger.info(f"🔍 Found {len(contours)} contours")
+            logger.debug("🔍 Found %d contours", len(contours))
+            
+            candidates = []
+            
+            if contours:
+                # Area and aspect filters for all contours in one vectorized pass
+                areas = np.array([cv2.contourArea(c) for c in contours])
+                rects = np.array([cv2.boundingRect(c) for c in contours])
+                aspect_ratios = rects[:, 2] / rects[:, 3]
+                
+                # License plates are typically 200-200000 pixels at full size
+                # with an aspect ratio between 1.0 and 6.0
+                mask = ((areas > self.min_plate_area * area_scale) & (areas < self.max_plate_area * area_scale) &
+                        (aspect_ratios >= 1.0) & (aspect_ratios <= 6.0))
+                
+                # Hull-based quality metrics only for the survivors
+                for i in np.flatnonzero(mask):
+                    area = areas[i]
+                    x, y, w, h = (int(v) for v in rects[i])
+                    
+                    hull_area = cv2.contourArea(cv2.convexHull(contours[i]))
+                    solidity = area / hull_area if hull_area > 0 else 0
+                    
+                    # Extent (ratio of contour area to bounding rectangle area)
+                    extent = area / (w * h)
+                    
+                    if solidity > 0.1 and extent > 0.1:
+                        # Rank by shape quality; cap area (20000 at full size)
+                        # so large non-plate blobs don't dominate
+                        score = solidity * extent * min(area, 20000 * area_scale)
+                        candidates.append((score, (x, y, w, h)))
+            
+            # Only OCR the best-ranked candidates, stopping at the first readable plate
+            candidates.sort(key=lambda c: c[0], reverse=True)
             
             detected_plates = []
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
+            for score, (x, y, w, h) in candidates[:3]:
+                # Map bbox back to full resolution
+                x, y = int(x * scale), int(y * scale)
+                w, h = int(w * scale), int(h * scale)
+                
+                logger.debug("🔍 Potential plate: bbox=(%d, %d, %d, %d), score=%.0f", x, y, w, h, score)
+                
+                # Extract plate region from the full-resolution grayscale frame for OCR
+                plate_gray = full_gray[y:y+h, x:x+w]
                 
-                # Filter by area (license plates are typically 200-200000 pixels) - very lenient
-                if 200 < area < 200000:
-                    x, y, w, h = cv2.boundingRect(contour)
-                    aspect_ratio = w / h
+                # Run OCR on the plate region
+                plate_text = self.extract_text_ocr(plate_gray)
+                
+                # Draw rectangle around detected plate
+                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+                
+                if plate_text and len(plate_text) >= 2:
+                    detected_plates.append({
+                        'text': plate_text,
+                        'confidence': 0.85,
+                        'timestamp': datetime.now(),
+                        'bbox': (x, y, w, h)
+                    })
                     
-                    # License plates typically have aspect ratio between 1.0 and 6.0 - very lenient
-                    if 1.0 <= aspect_ratio <= 6.0:
-                        # Calculate additional quality metrics
-                        hull = cv2.convexHull(contour)
-                        hull_area = cv2.contourArea(hull)
-                        solidity = area / hull_area if hull_area > 0 else 0
-                        
-                        # Calculate extent (ratio of contour area to bounding rectangle area)
-                        rect_area = w * h
-                        extent = area / rect_area if rect_area > 0 else 0
-                        
-                        # Very lenient quality requirements - just try OCR on everything
-                        if solidity > 0.1 and extent > 0.1:  # Very lenient
-                            logger.info(f"🔍 Potential plate: area={area:.0f}, aspect={aspect_ratio:.2f}, solidity={solidity:.2f}, extent={extent:.2f}")
-                            # Draw rectangle around detected plate
-                            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                            
-                            # Extract plate region
-                            plate_region = frame[y:y+h, x:x+w]
-                            
-                            # Try real OCR first, fallback to simulation
-                            plate_text = self.simulate_ocr(plate_region)
-                            
-                            if plate_text and len(plate_text) >= 2:  # Very lenient minimum length
-                                detected_plates.append({
-                                    'text': plate_text,
-                                    'confidence': 0.85,
-                                    'timestamp': datetime.now(),
-                                    'bbox': (x, y, w, h)
-                                })
-                                
-                                # Draw text on frame
-                                cv2.putText(frame, plate_text, (x, y-10), 
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                                logger.info(f"✅ Plate detected: {plate_text}")
-                            else:
-                                logger.warning(f"⚠️ OCR failed for potential plate: {plate_text}")
+                    # Draw text on frame
+                    cv2.putText(frame, plate_text, (x, y-10), 
+                               FONT, 0.7, (0, 255, 0), 2)
+                    logger.info(f"✅ Plate detected: {plate_text}")
+                    break
+                else:
+                    logger.debug("⚠️ OCR failed for potential plate: %s", plate_text)
             
             return detected_plates, frame
             
@@ -166,161 +254,89 @@ class ShobhaANPRSystem:
             logger.error(f"Plate detection error: {e}")
             return [], frame
     
-    def extract_text_ocr(self, plate_region):
-        """Extract text from plate region using real OCR"""
-        try:
-            # Try to import pytesseract
-            import pytesseract  # pyright: ignore[reportMissingImports]
-            
-            # Set Tesseract path for Windows
-            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-            
-            # Preprocess the plate region for better OCR
-            gray_plate = cv2.cvtColor(plate_region, cv2.COLOR_BGR2GRAY)
-            
-            # Apply additional preprocessing
-            # Resize if too small
-            if gray_plate.shape[0] < 50:
-                scale_factor = 50 / gray_plate.shape[0]
-                new_width = int(gray_plate.shape[1] * scale_factor)
-                gray_plate = cv2.resize(gray_plate, (new_width, 50))
-            
-            # Apply threshold to get binary image
-            _, binary = cv2.threshold(gray_plate, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Try different OCR configurations
-            configs = [
-                '--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 13 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-            ]
-            
-            best_text = ""
-            best_confidence = 0
-            
-            for config in configs:
-                try:
-                    # Get text and confidence
-                    data = pytesseract.image_to_data(binary, config=config, output_type=pytesseract.Output.DICT)
-                    
-                    # Extract text with confidence
-                    text_parts = []
-                    confidences = []
-                    
-                    for i in range(len(data['text'])):
-                        if int(data['conf'][i]) > 30:  # Only consider high confidence
-                            text_parts.append(data['text'][i].strip())
-                            confidences.append(int(data['conf'][i]))
-                    
-                    if text_parts:
-                        combined_text = ''.join(text_parts)
-                        avg_confidence = sum(confidences) / len(confidences)
-                        
-                        if avg_confidence > best_confidence and len(combined_text) >= 6:
-                            best_text = combined_text
-                            best_confidence = avg_confidence
-                            
-                except Exception as e:
-                    continue
-            
-            # Clean up the text
-            if best_text:
-                # Remove non-alphanumeric characters except spaces
-                cleaned_text = ''.join(c for c in best_text if c.isalnum())
-                
-                # Validate Indian plate format (basic check)
-                if len(cleaned_text) >= 6 and len(cleaned_text) <= 12:
-                    return cleaned_text
-            
+    def extract_text_ocr(self, plate_gray):
+        """Extract text from a grayscale plate region using real OCR"""
+        if pytesseract is None:
+            logger.warning("⚠️ pytesseract not installed - install with: pip install pytesseract")
             return None
-            
-        except ImportError:
-            # Fallback to simulation if pytesseract not available
-            return self.simulate_ocr(plate_region)
-        except Exception as e:
-            logger.error(f"OCR error: {e}")
+        
+        # Too small to hold readable characters - skip Tesseract
+        h, w = plate_gray.shape[:2]
+        if h * w < 600 or w < 60 or h < 15:
             return None
-    
-    def simulate_ocr(self, plate_region):
-        """Simulate OCR for testing when real OCR is not available"""
-        # Try real OCR first
+        
         try:
-            import pytesseract  # pyright: ignore[reportMissingImports]
-            
-            # Set Tesseract path for Windows
-            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-            
-            # Preprocess the plate region for better OCR
-            gray_plate = cv2.cvtColor(plate_region, cv2.COLOR_BGR2GRAY)
+            # Flat regions (below the noise floor) never contain text
+            if plate_gray.std() < 8:
+                return None
             
             # Apply additional preprocessing
             # Resize if too small
-            if gray_plate.shape[0] < 50:
-                scale_factor = 50 / gray_plate.shape[0]
-                new_width = int(gray_plate.shape[1] * scale_factor)
-                gray_plate = cv2.resize(gray_plate, (new_width, 50))
+            if plate_gray.shape[0] < 50:
+                scale_factor = 50 / plate_gray.shape[0]
+                new_width = int(plate_gray.shape[1] * scale_factor)
+                plate_gray = cv2.resize(plate_gray, (new_width, 50))
             
             # Apply threshold to get binary image
-            _, binary = cv2.threshold(gray_plate, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            _, binary = cv2.threshold(plate_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
             
-            # Try different OCR configurations
-            configs = [
-                '--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                '--psm 13 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-            ]
+            # Identical plate region read recently - reuse its OCR result
+            plate_hash = self.plate_region_hash(binary)
+            cached = self.ocr_cache.get(plate_hash)
+            if cached is not None:
+                stored_time, plate_text = cached
+                if time.monotonic() - stored_time < self.ocr_cache_ttl:
+                    self.ocr_cache.move_to_end(plate_hash)
+                    return plate_text
+                del self.ocr_cache[plate_hash]
             
-            best_text = ""
-            best_confidence = 0
+            plate_text = self.run_tesseract(binary)
             
-            for config in configs:
-                try:
-                    # Get text and confidence
-                    data = pytesseract.image_to_data(binary, config=config, output_type=pytesseract.Output.DICT)
-                    
-                    # Extract text with confidence
-                    text_parts = []
-                    confidences = []
-                    
-                    for i in range(len(data['text'])):
-                        if int(data['conf'][i]) > 30:  # Only consider high confidence
-                            text_parts.append(data['text'][i].strip())
-                            confidences.append(int(data['conf'][i]))
-                    
-                    if text_parts:
-                        combined_text = ''.join(text_parts)
-                        avg_confidence = sum(confidences) / len(confidences)
-                        
-                        if avg_confidence > best_confidence and len(combined_text) >= 6:
-                            best_text = combined_text
-                            best_confidence = avg_confidence
-                            
-                except Exception as e:
-                    continue
+            # Only successful reads are cached - a failed OCR must not block retries
+            if plate_text:
+                self.ocr_cache[plate_hash] = (time.monotonic(), plate_text)
+                if len(self.ocr_cache) > self.ocr_cache_size:
+                    self.ocr_cache.popitem(last=False)
             
-            # Clean up the text
-            if best_text:
-                # Remove non-alphanumeric characters except spaces
-                cleaned_text = ''.join(c for c in best_text if c.isalnum())
-                
-                # Validate Indian plate format (basic check)
-                if len(cleaned_text) >= 6 and len(cleaned_text) <= 12:
-                    logger.info(f"🔍 Real OCR detected: {cleaned_text} (confidence: {best_confidence:.1f}%)")
-                    return cleaned_text
-            
-            # If real OCR fails, return None instead of fake data
-            logger.warning("🔍 Real OCR failed - no plate text detected")
-            return None
+            return plate_text
             
-        except ImportError:
-            logger.warning("⚠️ pytesseract not installed - install with: pip install pytesseract")
-            return None
         except Exception as e:
             logger.error(f"OCR error: {e}")
             return None
     
+    def plate_region_hash(self, binary):
+        """Hash the full binarized plate region and its shape (cache key)"""
+        digest = hashlib.blake2b(np.packbits(binary > 127).tobytes(), digest_size=16)
+        digest.update(str(binary.shape).encode())
+        return digest.digest()
+    
+    def run_tesseract(self, binary):
+        """Run Tesseract on a binarized plate region and return the cleaned plate text"""
+        # Get text and confidence
+        data = pytesseract.image_to_data(binary, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+        
+        # Extract text with confidence
+        text_parts = []
+        confidences = []
+        
+        for i in range(len(data['text'])):
+            if int(data['conf'][i]) > 30:  # Only consider high confidence
+                text_parts.append(data['text'][i].strip())
+                confidences.append(int(data['conf'][i]))
+        
+        if text_parts:
+            # Remove non-alphanumeric characters
+            cleaned_text = ''.join(c for c in ''.join(text_parts) if c.isalnum())
+            avg_confidence = sum(confidences) / len(confidences)
+            
+            # Validate Indian plate format (basic check)
+            if len(cleaned_text) >= 6 and len(cleaned_text) <= 12:
+                logger.debug("🔍 Real OCR detected: %s (confidence: %.1f%%)", cleaned_text, avg_confidence)
+                return cleaned_text
+        
+        logger.debug("🔍 Real OCR failed - no plate text detected")
+        return None
+    
     def check_shobha_database(self, plate_number):
         """Check if plate exists in Shobha permanent parking and return vehicle info"""
         if not self.db_available:
@@ -336,117 +352,64 @@ class ShobhaANPRSystem:
                 }
             return None
         
+        vehicle_info = self.plate_map.get(plate_number)
+        if vehicle_info:
+            return vehicle_info
+        
+        # Not in the loaded map - may have been registered since the last refresh
         try:
             query = "SELECT id, vehicle_number, phone_number, vehicle_type, slot_number FROM shobha_permanent_parking WHERE vehicle_number = %s"
             result = self.db.execute_query(query, (plate_number,), fetch_one=True)
+            if result:
+                self.plate_map[plate_number] = result
             return result
         except Exception as e:
             logger.error(f"Database check error: {e}")
             return None
     
-    def handle_vehicle_entry(self, plate_number, vehicle_info):
-        """Handle vehicle entry - create session"""
-        if not self.db_available:
-            logger.info(f"Demo: Vehicle ENTRY - {plate_number}")
-            return True
-        
+    def refresh_plate_map(self):
+        """Reload all registered Shobha vehicles into the plate lookup map"""
         try:
-            permanent_id = vehicle_info['id']
-            
-            # Create entry session
-            session_query = """
-                INSERT INTO shobha_permanent_parking_sessions 
-                (permanent_parking_id, entry_time, created_at, updated_at)
-                VALUES (%s, %s, %s, %s)
-            """
-            success = self.db.execute_update(session_query, (
-                permanent_id, datetime.now(), datetime.now(), datetime.now()
-            ))
-            
-            if success:
-                logger.info(f"✅ ENTRY: {plate_number} - Session created")
-                return True
-            else:
-                logger.error(f"❌ ENTRY: {plate_number} - Session creation failed")
-                return False
-                
+            query = "SELECT id, vehicle_number, phone_number, vehicle_type, slot_number FROM shobha_permanent_parking"
+            vehicles = self.db.execute_query(query)
+            self.plate_map = {v['vehicle_number']: v for v in vehicles}
+            logger.debug("🔄 Loaded %d registered vehicles", len(self.plate_map))
         except Exception as e:
-            logger.error(f"Entry session creation error: {e}")
-            return False
+            logger.error(f"Plate map refresh error: {e}")
     
-    def handle_vehicle_exit(self, plate_number, vehicle_info):
-        """Handle vehicle exit - update session"""
-        if not self.db_available:
-            logger.info(f"Demo: Vehicle EXIT - {plate_number}")
-            return True
-        
-        try:
-            permanent_id = vehicle_info['id']
-            
-            # Find active session (entry without exit)
-            find_query = """
-                SELECT id FROM shobha_permanent_parking_sessions 
-                WHERE permanent_parking_id = %s AND exit_time IS NULL
-                ORDER BY entry_time DESC LIMIT 1
-            """
-            session_result = self.db.execute_query(find_query, (permanent_id,), fetch_one=True)
-            
-            if session_result:
-                session_id = session_result['id']
-                exit_time = datetime.now()
-                
-                # Update session with exit time
-                update_query = """
-                    UPDATE shobha_permanent_parking_sessions 
-                    SET exit_time = %s, duration_minutes = EXTRACT(EPOCH FROM (%s - entry_time))/60, updated_at = %s
-                    WHERE id = %s
-                """
-                success = self.db.execute_update(update_query, (exit_time, exit_time, exit_time, session_id))
-                
-                if success:
-                    logger.info(f"✅ EXIT: {plate_number} - Session updated")
-                    return True
-                else:
-                    logger.error(f"❌ EXIT: {plate_number} - Session update failed")
-                    return False
-            else:
-                logger.warning(f"❌ EXIT: {plate_number} - No active session found")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Exit session update error: {e}")
-            return False
+    def plate_map_loop(self):
+        """Refresh the registered vehicle map periodically (background thread)"""
+        while not self.plate_map_stop.wait(self.plate_map_refresh_interval):
+            self.refresh_plate_map()
     
-    def determine_entry_or_exit(self, plate_number, vehicle_info):
-        """Determine if this is an entry or exit based on active sessions"""
+    def record_vehicle_movement(self, plate_number, vehicle_info):
+        """Close the active session (EXIT) or open a new one (ENTRY) in one round-trip.
+        
+        Returns True for an entry, False for an exit, None if nothing was recorded.
+        """
         if not self.db_available:
             # Demo mode - alternate between entry and exit
-            return len(self.detected_plates) % 2 == 0
+            is_entry = len(self.detected_plates) % 2 == 0
+            logger.info(f"Demo: Vehicle {'ENTRY' if is_entry else 'EXIT'} - {plate_number}")
+            return is_entry
         
         try:
-            permanent_id = vehicle_info['id']
-            
-            # Check if there's an active session (entry without exit)
-            query = """
-                SELECT COUNT(*) as active_count FROM shobha_permanent_parking_sessions 
-                WHERE permanent_parking_id = %s AND exit_time IS NULL
-            """
-            result = self.db.execute_query(query, (permanent_id,), fetch_one=True)
-            
-            if result and result['active_count'] > 0:
-                # Has active session - this is an EXIT
-                return False
-            else:
-                # No active session - this is an ENTRY
-                return True
+            action = self.db.record_permanent_movement(vehicle_info['id'])
+            if action is None:
+                logger.error(f"❌ {plate_number} - Session entry/exit was not recorded")
+                return None
+            
+            # Sessions changed - drop cached stats so the next poll sees it
+            self.stats_cache = None
+            logger.info(f"✅ {action.upper()}: {plate_number} - Session {'created' if action == 'entry' else 'updated'}")
+            return action == 'entry'
                 
         except Exception as e:
-            logger.error(f"Entry/Exit determination error: {e}")
-            # Default to entry if error
-            return True
+            logger.error(f"Entry/Exit session error: {e}")
+            return None
     
     def detection_loop(self):
-        """Main detection loop running in separate thread"""
+        """Main detection loop running in separate thread - the only reader of self.camera"""
         self.running = True
         
         while self.running:
@@ -455,6 +418,10 @@ class ShobhaANPRSystem:
                     ret, frame = self.camera.read()
                     if ret:
                         current_time = time.time()
+                        seen_time = time.monotonic()
+                        
+                        # Encode once for all live feed viewers (before detection draws on the frame)
+                        self.publish_live_frame(frame)
                         
                         # Detect plates every 2 seconds
                         if current_time - self.last_detection_time >= self.detection_interval:
@@ -462,18 +429,18 @@ class ShobhaANPRSystem:
                             
                             # Debug: Log detection attempts
                             if len(detected_plates) > 0:
-                                logger.info(f"🔍 Detected {len(detected_plates)} potential plates")
+                                logger.debug("🔍 Detected %d potential plates", len(detected_plates))
                             
                             for plate in detected_plates:
                                 plate_text = plate['text']
                                 
                                 # Check if already detected recently
-                                if not any(p['text'] == plate_text and 
-                                         (current_time - p['timestamp'].timestamp()) < 10 
-                                         for p in self.detected_plates):
+                                existing = self.detected_plates.get(plate_text)
+                                if not (existing and (seen_time - existing[0]) < 10):
                                     
-                                    # Add to detected plates list
-                                    self.detected_plates.append(plate)
+                                    # Add to detected plates (re-detections move to the newest end)
+                                    self.detected_plates[plate_text] = (seen_time, plate)
+                                    self.detected_plates.move_to_end(plate_text)
                                     
                                     logger.info(f"📋 New plate detected: {plate_text}")
                                     
@@ -481,65 +448,96 @@ class ShobhaANPRSystem:
                                     vehicle_info = self.check_shobha_database(plate_text)
                                     
                                     if vehicle_info:
-                                        # Vehicle is authorized - determine IN or OUT
-                                        is_entry = self.determine_entry_or_exit(plate_text, vehicle_info)
+                                        # Vehicle is authorized - record IN or OUT
+                                        is_entry = self.record_vehicle_movement(plate_text, vehicle_info)
                                         
-                                        # Update plate info with entry/exit status
+                                        # Update plate info with entry/exit status (None - shown as unknown - if not recorded)
                                         plate['is_entry'] = is_entry
                                         plate['vehicle_info'] = vehicle_info
                                         
-                                        if is_entry:
-                                            # Handle ENTRY
-                                            success = self.handle_vehicle_entry(plate_text, vehicle_info)
-                                            if success:
-                                                logger.info(f"🚪 ENTRY: {plate_text} - Barrier opening")
-                                                # TODO: Open boom barrier for entry
-                                            else:
-                                                logger.error(f"❌ ENTRY: {plate_text} - Session creation failed")
+                                        if is_entry is None:
+                                            logger.error(f"❌ {plate_text} - Entry/exit not recorded, barrier stays closed")
                                         else:
-                                            # Handle EXIT
-                                            success = self.handle_vehicle_exit(plate_text, vehicle_info)
-                                            if success:
-                                                logger.info(f"🚪 EXIT: {plate_text} - Barrier opening")
-                                                # TODO: Open boom barrier for exit
-                                            else:
-                                                logger.error(f"❌ EXIT: {plate_text} - Session update failed")
+                                            logger.info(f"🚪 {'ENTRY' if is_entry else 'EXIT'}: {plate_text} - Barrier opening")
+                                            # TODO: Open boom barrier
                                     else:
                                         logger.info(f"❌ Unauthorized vehicle: {plate_text}")
                                         plate['is_entry'] = None
                                         # TODO: Deny access (buzzer)
+                                    
+                                    self.publish_plate_change(plate)
                             
                             self.last_detection_time = current_time
                         
-                        # Keep only recent detections (last 30 seconds)
-                        self.detected_plates = [
-                            p for p in self.detected_plates 
-                            if (current_time - p['timestamp'].timestamp()) < 30
-                        ]
+                        # Keep only recent detections (last 30 seconds) - oldest entries are at the front
+                        while self.detected_plates:
+                            oldest_seen, _ = next(iter(self.detected_plates.values()))
+                            if (seen_time - oldest_seen) < 30:
+                                break
+                            self.detected_plates.popitem(last=False)
+                            self.publish_plate_change()
                 
-                time.sleep(0.1)  # Small delay to prevent high CPU usage
+                if self.live_viewers:
+                    time.sleep(0.1)  # Keep ~10 fps for live feed viewers
+                else:
+                    # Nobody is watching - don't read frames until the next detection is due
+                    time.sleep(max(0.1, self.detection_interval - (time.time() - self.last_detection_time)))
                 
             except Exception as e:
                 logger.error(f"Detection loop error: {e}")
                 time.sleep(1)
+        
+        # Release the camera from the thread that owns it
+        if self.camera:
+            self.camera.release()
+    
+    def stop(self):
+        """Stop the detection loop and wait for it to release the camera"""
+        self.running = False
+        self.plate_map_stop.set()
+        self.detection_thread.join(timeout=5)
+    
+    def publish_plate_change(self, plate=None):
+        """Bump the detected plates revision and wake plate stream listeners"""
+        with self.plate_condition:
+            self.plates_revision += 1
+            if plate is not None:
+                self.plate_events.append((self.plates_revision, plate))
+            self.plate_condition.notify_all()
+    
+    def wait_for_new_plates(self, last_revision, timeout=15):
+        """Wait for changes after last_revision, return (current revision, newly detected plates)"""
+        with self.plate_condition:
+            self.plate_condition.wait_for(lambda: self.plates_revision > last_revision, timeout=timeout)
+            new_plates = [plate for revision, plate in self.plate_events if revision > last_revision]
+            return self.plates_revision, new_plates
+    
+    def publish_live_frame(self, frame):
+        """Encode a camera frame as JPEG and hand it to waiting live feed viewers"""
+        # Resize frame for web display
+        frame = cv2.resize(frame, (640, 480))
+        
+        # Encode frame as JPEG (SIMD libjpeg-turbo when available)
+        if turbo_jpeg is not None:
+            jpeg = turbo_jpeg.encode(frame, quality=70)
+        else:
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            jpeg = buffer.tobytes() if ret else None
+        
+        if jpeg:
+            with self.jpeg_condition:
+                self.latest_jpeg = jpeg
+                self.jpeg_condition.notify_all()
     
     def get_live_frame(self):
-        """Get live camera frame for streaming"""
-        if self.camera and self.camera.isOpened():
-            ret, frame = self.camera.read()
-            if ret:
-                # Resize frame for web display
-                frame = cv2.resize(frame, (640, 480))
-                
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if ret:
-                    return buffer.tobytes()
-        return None
+        """Get latest encoded camera frame for streaming, waiting briefly for a new one"""
+        with self.jpeg_condition:
+            self.jpeg_condition.wait(timeout=0.1)
+            return self.latest_jpeg
     
     def get_detected_plates(self):
         """Get list of recently detected plates"""
-        return sorted(self.detected_plates, key=lambda x: x['timestamp'], reverse=True)
+        return [plate for _, plate in reversed(list(self.detected_plates.values()))]
     
     def get_shobha_stats(self):
         """Get Shobha-specific statistics"""
@@ -554,23 +552,29 @@ class ShobhaANPRSystem:
             }
         
         try:
-            # Get total permanent vehicles
-            total_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking"
-            total_result = self.db.execute_query(total_query, fetch_one=True)
-            total_vehicles = total_result['count'] if total_result else 0
-            
-            # Get vehicles currently IN (active sessions)
-            in_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions WHERE exit_time IS NULL"
-            in_result = self.db.execute_query(in_query, fetch_one=True)
-            vehicles_in = in_result['count'] if in_result else 0
+            current_time = time.time()
+            
+            # Reuse recent counts to absorb dashboard polling bursts
+            # Read the cache once - record_vehicle_movement clears it from the detection thread
+            result = self.stats_cache
+            if result is None or current_time - self.stats_cache_time >= self.stats_cache_ttl:
+                # Total vehicles, vehicles currently IN (active sessions) and
+                # vehicles OUT (completed sessions today) in one round-trip
+                stats_query = """
+                    SELECT
+                        (SELECT COUNT(*) FROM shobha_permanent_parking) AS total_vehicles,
+                        (SELECT COUNT(*) FROM shobha_permanent_parking_sessions
+                         WHERE exit_time IS NULL) AS vehicles_in,
+                        (SELECT COUNT(*) FROM shobha_permanent_parking_sessions
+                         WHERE exit_time IS NOT NULL AND DATE(exit_time) = CURRENT_DATE) AS vehicles_out
+                """
+                result = self.db.execute_query(stats_query, fetch_one=True)
+                self.stats_cache_time = current_time
+                self.stats_cache = result
             
-            # Get vehicles OUT (completed sessions today)
-            out_query = """
-                SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions 
-                WHERE exit_time IS NOT NULL AND DATE(exit_time) = CURRENT_DATE
-            """
-            out_result = self.db.execute_query(out_query, fetch_one=True)
-            vehicles_out = out_result['count'] if out_result else 0
+            total_vehicles = result['total_vehicles'] if result else 0
+            vehicles_in = result['vehicles_in'] if result else 0
+            vehicles_out = result['vehicles_out'] if result else 0
             
             return {
                 'total_vehicles': total_vehicles,
@@ -594,30 +598,60 @@ class ShobhaANPRSystem:
 # Create global ANPR system instance
 anpr_system = ShobhaANPRSystem()
 
+# The dashboard page has no template variables - render it once and reuse the bytes
+index_html = None
+
 @app.route('/')
 def index():
     """Main dashboard page"""
-    return render_template('shodha_dashboard.html')
+    global index_html
+    if index_html is None:
+        index_html = render_template('shodha_dashboard.html').encode('utf-8')
+    return Response(index_html, mimetype='text/html')
 
 @app.route('/api/live_feed')
 def live_feed():
     """Live camera feed endpoint"""
     def generate_frames():
-        while True:
-            frame = anpr_system.get_live_frame()
-            if frame:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.1)
+        with anpr_system.jpeg_condition:
+            anpr_system.live_viewers += 1
+        try:
+            while True:
+                frame = anpr_system.get_live_frame()
+                if frame:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        finally:
+            with anpr_system.jpeg_condition:
+                anpr_system.live_viewers -= 1
     
     return Response(generate_frames(),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/detected_plates')
 def detected_plates():
-    """Get recently detected plates"""
-    plates = anpr_system.get_detected_plates()
-    return jsonify(plates)
+    """Get recently detected plates (304 if unchanged since the client's ETag)"""
+    etag = f"{anpr_system.plates_epoch}-{anpr_system.plates_revision}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(anpr_system.get_detected_plates())
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/plate_stream')
+def plate_stream():
+    """Push newly detected plates as server-sent events"""
+    def generate_events():
+        revision = anpr_system.plates_revision
+        while True:
+            revision, new_plates = anpr_system.wait_for_new_plates(revision)
+            if not new_plates:
+                yield ': keepalive\n\n'
+            for plate in new_plates:
+                yield f"data: {app.json.dumps(plate)}\n\n"
+    
+    return Response(generate_events(), mimetype='text/event-stream')
 
 @app.route('/api/stats')
 def stats():
@@ -653,9 +687,7 @@ def main():
         app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     except KeyboardInterrupt:
         print("\n🛑 Shutting down...")
-        anpr_system.running = False
-        if anpr_system.camera:
-            anpr_system.camera.release()
+        anpr_system.stop()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -10,27 +10,40 @@ from flask_cors import CORS
 import cv2
 import numpy as np
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import time
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import logging
+import requests
+
+from camera_settings import CAMERA_BACKEND
+from dashboard_json import configure_json
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+configure_json(app)
 CORS(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Plate Recognizer API - pooled keep-alive connections, candidate regions sent in parallel
+PLATE_RECOGNIZER_URL = "https://api.platerecognizer.com/v1/plate-reader/"
+api_session = requests.Session()
+api_pool = ThreadPoolExecutor(max_workers=4)
+
 class ShobhaSmartANPRSystem:
     def __init__(self):
         self.camera = None
         self.running = False
-        self.detected_plates = []
+        self.detected_plates = OrderedDict()  # plate text -> (monotonic time seen, plate info), oldest first
+        self.plates_lock = threading.Lock()  # detection thread writes, Flask request threads read
         self.last_detection_time = 0
         self.detection_interval = 2.0  # 2 seconds between detections
         
@@ -39,15 +52,56 @@ class ShobhaSmartANPRSystem:
         self.max_plate_area = 100000
         self.min_aspect_ratio = 1.5
         self.max_aspect_ratio = 5.0
+        self.detection_scale = 0.5  # Region proposals run on a downscaled frame
+        # Optional gate region "x0,y0,x1,y1" in frame pixels - plates are only searched inside it
+        self.detection_roi = self.parse_detection_roi(os.getenv('DETECTION_ROI'))
+        
+        # Preprocessing objects reused on every frame
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        self.sharpen_kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+        self.morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        
+        # OpenCL acceleration (e.g. Intel iGPU) for preprocessing, if present
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        cv2.ocl.setUseOpenCL(self.use_opencl)
+        
+        # Permanent parking lookups: plate -> (time fetched, row), least recently used evicted first
+        self.plate_cache = OrderedDict()
+        self.plate_cache_size = 256
+        self.plate_cache_ttl = 300  # seconds
+        
+        # Dashboard stats, cached briefly so concurrent polls share one query
+        self.stats_cache = None
+        self.stats_cache_time = 0
+        self.stats_cache_ttl = float(os.getenv('STATS_CACHE_TTL', '10'))
+        
+        # Motion gate - skip detection while the scene matches the last processed frame
+        self.motion_reference = None
+        self.motion_reference_time = 0
+        self.motion_threshold = 3.0  # mean absolute gray-level difference
+        self.motion_recheck_interval = 5.0  # seconds - a still scene (car waiting at the barrier) is still retried
         
         # API settings
         self.api_key = os.getenv('PLATE_RECOGNIZER_API_KEY')
         self.api_available = bool(self.api_key and self.api_key != "YOUR_API_KEY_HERE")
+        self.api_max_width = 400  # Plate crops are downscaled to this width before upload
         
         # Detection history to avoid duplicates
-        self.recent_detections = []
+        self.recent_detections = OrderedDict()  # plate text -> {'bbox', 'timestamp'}, oldest first
         self.detection_cooldown = 10  # seconds
         
+        # Latest JPEG-encoded frame shared by all live feed viewers
+        self.latest_jpeg = None
+        self.jpeg_condition = threading.Condition()
+        self.live_viewers = 0  # Frames are only encoded while someone is watching
+        self.live_frame_interval = 0.1  # Encode at most ~10 fps for live feed viewers
+        self.last_live_frame_time = 0
+        
+        # Latest raw camera frame for the detection thread - overwritten, never queued
+        self.latest_frame = None
+        self.frame_id = 0
+        self.frame_condition = threading.Condition()
+        
         # Database connection (Shobha tables only)
         try:
             from secure_database_connection import secure_db
@@ -62,24 +116,29 @@ class ShobhaSmartANPRSystem:
         # Initialize camera
         self.init_camera()
         
-        # Start detection thread
+        # Start capture and detection threads
+        self.running = True
+        self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
+        self.capture_thread.start()
         self.detection_thread = threading.Thread(target=self.detection_loop, daemon=True)
         self.detection_thread.start()
         
-        logger.info(f"🔧 Smart ANPR System initialized - API: {'✅ Available' if self.api_available else '❌ Not available'}")
+        logger.info(f"🔧 Smart ANPR System initialized - API: {'✅ Available' if self.api_available else '❌ Not available'}, OpenCL: {'✅' if self.use_opencl else '❌'}")
     
     def init_camera(self):
         """Initialize camera for live feed"""
         try:
-            self.camera = cv2.VideoCapture(0)
+            self.camera = cv2.VideoCapture(0, CAMERA_BACKEND)
             if not self.camera.isOpened():
                 logger.error("❌ Could not open camera")
                 return False
             
-            # Set camera properties
+            # Set camera properties (MJPG before the size, or YUYV caps the frame rate)
+            self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
             self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
             self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             self.camera.set(cv2.CAP_PROP_FPS, 30)
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Read the newest frame, not a driver backlog
             
             logger.info("✅ Camera initialized successfully")
             return True
@@ -87,75 +146,120 @@ class ShobhaSmartANPRSystem:
             logger.error(f"❌ Camera initialization failed: {e}")
             return False
     
-    def detect_potential_plates_opencv(self, frame):
-        """Use OpenCV to detect potential plate regions (fast, local)"""
+    def parse_detection_roi(self, value):
+        """Parse DETECTION_ROI "x0,y0,x1,y1" - None (whole frame) when unset or invalid"""
+        if not value:
+            return None
+        try:
+            x0, y0, x1, y1 = (int(v) for v in value.split(','))
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring DETECTION_ROI={value!r} - expected four integers x0,y0,x1,y1")
+            return None
+        if x0 < 0 or y0 < 0 or x1 <= x0 or y1 <= y0:
+            logger.warning(f"⚠️ Ignoring DETECTION_ROI={value!r} - needs 0 <= x0 < x1 and 0 <= y0 < y1")
+            return None
+        return x0, y0, x1, y1
+    
+    def detect_potential_plates_opencv(self, gray):
+        """Use OpenCV to detect potential plate regions (fast, local) in the grayscale frame"""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Crop to the gate region (a NumPy view, no copy)
+            offset_x = offset_y = 0
+            if self.detection_roi:
+                # Clamp to the frame - a region that leaves no room for a plate is dropped once
+                offset_x, offset_y, x1, y1 = self.detection_roi
+                x1, y1 = min(x1, gray.shape[1]), min(y1, gray.shape[0])
+                if x1 > offset_x and y1 > offset_y and (x1 - offset_x) * (y1 - offset_y) >= self.min_plate_area:
+                    gray = gray[offset_y:y1, offset_x:x1]
+                else:
+                    logger.warning(f"⚠️ DETECTION_ROI {self.detection_roi} is outside the "
+                                   f"{gray.shape[1]}x{gray.shape[0]} frame - searching the whole frame")
+                    self.detection_roi = None
+                    offset_x = offset_y = 0
             
-            # Apply CLAHE for better contrast
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(gray)
+            # Downscale - region proposals don't need full resolution
+            small = cv2.resize(gray, (0, 0), fx=self.detection_scale, fy=self.detection_scale,
+                               interpolation=cv2.INTER_AREA)
+            scale = 1 / self.detection_scale
             
-            # Apply bilateral filter
-            filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
+            # Run the filter stack through OpenCL (T-API) when a device is available
+            if self.use_opencl:
+                small = cv2.UMat(small)
             
-            # Apply Gaussian blur
-            blurred = cv2.GaussianBlur(filtered, (5, 5), 0)
+            # Apply CLAHE for better contrast
+            enhanced = self.clahe.apply(small)
             
-            # Apply sharpening
-            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-            sharpened = cv2.filter2D(blurred, -1, kernel)
+            # Apply Gaussian blur (bilateral filtering adds little for region proposals)
+            blurred = cv2.GaussianBlur(enhanced, (5, 5), 0)
             
-            # Multiple edge detection
-            edges1 = cv2.Canny(sharpened, 50, 150)
-            edges2 = cv2.Canny(sharpened, 100, 200)
-            edges3 = cv2.Canny(sharpened, 30, 100)
+            # Apply sharpening
+            sharpened = cv2.filter2D(blurred, -1, self.sharpen_kernel)
             
-            # Combine edges
-            combined_edges = cv2.bitwise_or(edges1, edges2)
-            combined_edges = cv2.bitwise_or(combined_edges, edges3)
+            # Single Canny pass with thresholds derived from the median intensity, floored at the
+            # fixed (30, 100) pair so dark or night frames don't flood the edge map with noise
+            median = np.median(sharpened.get() if self.use_opencl else sharpened)
+            lower = int(max(30, 0.66 * median))
+            upper = int(max(100, min(255, 1.33 * median)))
+            edges = cv2.Canny(sharpened, lower, upper)
             
             # Morphological operations
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-            morphed = cv2.morphologyEx(combined_edges, cv2.MORPH_CLOSE, kernel)
+            morphed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, self.morph_kernel)
+            if self.use_opencl:
+                morphed = morphed.get()  # findContours is CPU-only
             
             # Find contours
             contours, _ = cv2.findContours(morphed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
-            potential_plates = []
+            if not contours:
+                return []
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                
-                # Filter by area
-                if self.min_plate_area < area < self.max_plate_area:
-                    x, y, w, h = cv2.boundingRect(contour)
-                    aspect_ratio = w / h
-                    
-                    # Filter by aspect ratio
-                    if self.min_aspect_ratio <= aspect_ratio <= self.max_aspect_ratio:
-                        # Calculate quality metrics
-                        hull = cv2.convexHull(contour)
-                        hull_area = cv2.contourArea(hull)
-                        solidity = area / hull_area if hull_area > 0 else 0
-                        
-                        rect_area = w * h
-                        extent = area / rect_area if rect_area > 0 else 0
-                        
-                        # Quality filter
-                        if solidity > 0.3 and extent > 0.2:
-                            potential_plates.append({
-                                'bbox': (x, y, w, h),
-                                'area': area,
-                                'aspect_ratio': aspect_ratio,
-                                'solidity': solidity,
-                                'extent': extent
-                            })
+            # Bounding boxes for all contours in one array, scaled back to full-resolution frame coordinates
+            rects = (np.array([cv2.boundingRect(c) for c in contours]) * scale).astype(int)
+            rects[:, 0] += offset_x
+            rects[:, 1] += offset_y
+            aspect_ratios = rects[:, 2] / np.maximum(rects[:, 3], 1)
+            
+            # Cheap prefilter on the boxes - a contour's area can't exceed its bounding box
+            keep = np.flatnonzero(
+                (rects[:, 2] * rects[:, 3] > self.min_plate_area) &
+                (aspect_ratios >= self.min_aspect_ratio) & (aspect_ratios <= self.max_aspect_ratio)
+            )
+            if keep.size == 0:
+                return []
+            
+            # Contour areas only for the boxes that passed
+            areas = np.zeros(len(contours))
+            areas[keep] = [cv2.contourArea(contours[i]) for i in keep]
+            areas *= scale * scale
+            keep = keep[(areas[keep] > self.min_plate_area) & (areas[keep] < self.max_plate_area)]
+            if keep.size == 0:
+                return []
+            
+            # Quality metrics, hulls only for the survivors
+            hull_areas = np.array([cv2.contourArea(cv2.convexHull(contours[i])) for i in keep]) * scale * scale
+            solidities = np.divide(areas[keep], hull_areas, out=np.zeros(keep.size), where=hull_areas > 0)
+            extents = areas[keep] / (rects[keep, 2] * rects[keep, 3])
+            
+            # Quality filter
+            good = (solidities > 0.3) & (extents > 0.2)
+            keep, solidities, extents = keep[good], solidities[good], extents[good]
             
             # Sort by quality and return top 3
-            potential_plates.sort(key=lambda x: x['area'] * x['solidity'] * x['extent'], reverse=True)
-            return potential_plates[:3]
+            scores = areas[keep] * solidities * extents
+            top = np.argsort(scores)[::-1][:3]
+            
+            potential_plates = []
+            for j in top:
+                i = keep[j]
+                x, y, w, h = (int(v) for v in rects[i])
+                potential_plates.append({
+                    'bbox': (x, y, w, h),
+                    'area': float(areas[i]),
+                    'aspect_ratio': float(aspect_ratios[i]),
+                    'solidity': float(solidities[j]),
+                    'extent': float(extents[j])
+                })
+            return potential_plates
             
         except Exception as e:
             logger.error(f"OpenCV detection error: {e}")
@@ -167,30 +271,29 @@ class ShobhaSmartANPRSystem:
             return self.fallback_ocr(frame, region)
         
         try:
-            import requests
-            import base64
-            
             x, y, w, h = region['bbox']
-            plate_region = frame[y:y+h, x:x+w]
-            
-            # Convert to base64
-            _, buffer = cv2.imencode('.jpg', plate_region)
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Prepare request
-            data = {
-                'image': image_base64,
-                'regions': ['in'],  # Focus on Indian plates
-            }
+            # One contiguous copy of the crop for resizing and JPEG encoding
+            plate_region = np.ascontiguousarray(frame[y:y+h, x:x+w])
+            
+            # Upload raw JPEG bytes as multipart (no base64 inflation)
+            # Keep the upload small - plates OCR fine at 400px wide and JPEG quality 75
+            crop_h, crop_w = plate_region.shape[:2]
+            if crop_w > self.api_max_width:
+                plate_region = cv2.resize(plate_region, (self.api_max_width, int(crop_h * self.api_max_width / crop_w)),
+                                          interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', plate_region, [cv2.IMWRITE_JPEG_QUALITY, 75, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+            files = {'upload': ('plate.jpg', buffer.tobytes(), 'image/jpeg')}
+            data = {'regions': 'in'}  # Focus on Indian plates
             
             headers = {
                 "Authorization": f"Token {self.api_key}"
             }
             
             # Make API request
-            response = requests.post(
-                "https://api.platerecognizer.com/v1/plate-reader/",
+            response = api_session.post(
+                PLATE_RECOGNIZER_URL,
                 headers=headers,
+                files=files,
                 data=data,
                 timeout=5
             )
@@ -198,6 +301,7 @@ class ShobhaSmartANPRSystem:
             if response.status_code == 200:
                 result = response.json()
                 plates = []
+                now = datetime.now()  # One timestamp for every plate in this response
                 
                 for detection in result.get('results', []):
                     plate_text = detection.get('plate', '').upper().strip()
@@ -207,7 +311,7 @@ class ShobhaSmartANPRSystem:
                         plates.append({
                             'text': plate_text,
                             'confidence': confidence,
-                            'timestamp': datetime.now(),
+                            'timestamp': now,
                             'bbox': region['bbox'],
                             'source': 'api'
                         })
@@ -245,35 +349,38 @@ class ShobhaSmartANPRSystem:
         """Check if this is a duplicate detection"""
         current_time = time.time()
         
-        # Clean up old detections
-        self.recent_detections = [
-            d for d in self.recent_detections 
-            if current_time - d['timestamp'] < self.detection_cooldown
-        ]
+        # Clean up old detections - oldest entries are at the front
+        while self.recent_detections:
+            oldest = next(iter(self.recent_detections.values()))
+            if current_time - oldest['timestamp'] < self.detection_cooldown:
+                break
+            self.recent_detections.popitem(last=False)
         
         # Check for duplicates
-        for detection in self.recent_detections:
-            if (detection['text'] == plate_text and 
-                abs(detection['bbox'][0] - bbox[0]) < 50 and
-                abs(detection['bbox'][1] - bbox[1]) < 50):
-                return True
-        
-        return False
+        detection = self.recent_detections.get(plate_text)
+        return bool(detection and
+                    abs(detection['bbox'][0] - bbox[0]) < 50 and
+                    abs(detection['bbox'][1] - bbox[1]) < 50)
     
-    def detect_license_plates(self, frame):
-        """Main detection function - smart hybrid approach"""
+    def detect_license_plates(self, frame, gray):
+        """Main detection function - smart hybrid approach (gray is the frame's grayscale, shared with the motion gate)"""
         try:
             # Step 1: Use OpenCV to find potential plate regions
-            potential_plates = self.detect_potential_plates_opencv(frame)
+            potential_plates = self.detect_potential_plates_opencv(gray)
             
             if not potential_plates:
                 return [], frame
             
             logger.info(f"🔍 Found {len(potential_plates)} potential plates")
             
+            # Step 2: Send all regions to API for accurate OCR in parallel
+            # (before drawing, so overlays don't end up in the uploaded crops)
+            futures = [api_pool.submit(self.send_to_api, frame, region) for region in potential_plates]
+            region_results = [future.result() for future in futures]  # all crops taken before drawing
+            
             detected_plates = []
             
-            for region in potential_plates:
+            for region, api_results in zip(potential_plates, region_results):
                 x, y, w, h = region['bbox']
                 
                 # Draw rectangle around potential plate
@@ -281,20 +388,17 @@ class ShobhaSmartANPRSystem:
                 cv2.putText(frame, "Potential Plate", (x, y - 10), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                 
-                # Step 2: Send to API for accurate OCR
-                api_results = self.send_to_api(frame, region)
-                
                 for plate in api_results:
                     # Check for duplicates
                     if not self.is_duplicate_detection(plate['text'], plate['bbox']):
                         detected_plates.append(plate)
                         
-                        # Add to recent detections
-                        self.recent_detections.append({
-                            'text': plate['text'],
+                        # Add to recent detections (re-detections move to the newest end)
+                        self.recent_detections[plate['text']] = {
                             'bbox': plate['bbox'],
                             'timestamp': time.time()
-                        })
+                        }
+                        self.recent_detections.move_to_end(plate['text'])
                         
                         # Draw final result
                         cv2.putText(frame, plate['text'], (x, y - 30), 
@@ -325,125 +429,131 @@ class ShobhaSmartANPRSystem:
                 }
             return None
         
+        # Registered vehicles rarely change - serve repeat gate events from memory
+        current_time = time.time()
+        cached = self.plate_cache.get(plate_number)
+        if cached and current_time - cached[0] < self.plate_cache_ttl:
+            self.plate_cache.move_to_end(plate_number)
+            return cached[1]
+        
         try:
             query = "SELECT id, vehicle_number, phone_number, vehicle_type, slot_number FROM shobha_permanent_parking WHERE vehicle_number = %s"
             result = self.db.execute_query(query, (plate_number,), fetch_one=True)
+            
+            # Only cache registered vehicles, so newly added ones are picked up immediately
+            if result:
+                self.plate_cache[plate_number] = (current_time, result)
+                self.plate_cache.move_to_end(plate_number)
+                if len(self.plate_cache) > self.plate_cache_size:
+                    self.plate_cache.popitem(last=False)
             return result
         except Exception as e:
             logger.error(f"Database check error: {e}")
             return None
     
-    def handle_vehicle_entry(self, plate_number, vehicle_info):
-        """Handle vehicle entry - create session"""
+    def record_vehicle_movement(self, plate_number, vehicle_info):
+        """Close the active session (EXIT) or open a new one (ENTRY) in one round-trip.
+        
+        Returns True for an entry, False for an exit, None if nothing was recorded.
+        """
         if not self.db_available:
-            logger.info(f"Demo: Vehicle ENTRY - {plate_number}")
-            return True
+            # Demo mode - alternate between entry and exit
+            is_entry = len(self.detected_plates) % 2 == 0
+            logger.info(f"Demo: Vehicle {'ENTRY' if is_entry else 'EXIT'} - {plate_number}")
+            return is_entry
         
         try:
-            permanent_id = vehicle_info['id']
-            
-            # Create entry session
-            session_query = """
-                INSERT INTO shobha_permanent_parking_sessions 
-                (permanent_parking_id, entry_time, created_at, updated_at)
-                VALUES (%s, %s, %s, %s)
-            """
-            success = self.db.execute_update(session_query, (
-                permanent_id, datetime.now(), datetime.now(), datetime.now()
-            ))
-            
-            if success:
-                logger.info(f"✅ ENTRY: {plate_number} - Session created")
-                return True
-            else:
-                logger.error(f"❌ ENTRY: {plate_number} - Session creation failed")
-                return False
+            action = self.db.record_permanent_movement(vehicle_info['id'])
+            if action is None:
+                logger.error(f"❌ {plate_number} - Session entry/exit was not recorded")
+                return None
+            
+            # Sessions changed - drop cached stats so the next poll sees it
+            self.stats_cache = None
+            logger.info(f"✅ {action.upper()}: {plate_number} - Session {'created' if action == 'entry' else 'updated'}")
+            return action == 'entry'
                 
         except Exception as e:
-            logger.error(f"Entry session creation error: {e}")
-            return False
+            logger.error(f"Entry/Exit session error: {e}")
+            return None
     
-    def handle_vehicle_exit(self, plate_number, vehicle_info):
-        """Handle vehicle exit - update session"""
-        if not self.db_available:
-            logger.info(f"Demo: Vehicle EXIT - {plate_number}")
-            return True
+    def has_motion(self, gray):
+        """Check if the grayscale frame differs from the last frame that was run through detection
+        (always True once motion_recheck_interval has passed, so a missed read is retried)"""
+        small = cv2.resize(gray, (160, 120), interpolation=cv2.INTER_AREA)
+        now = time.monotonic()
         
-        try:
-            permanent_id = vehicle_info['id']
-            
-            # Find active session
-            find_query = """
-                SELECT id FROM shobha_permanent_parking_sessions 
-                WHERE permanent_parking_id = %s AND exit_time IS NULL
-                ORDER BY entry_time DESC LIMIT 1
-            """
-            session_result = self.db.execute_query(find_query, (permanent_id,), fetch_one=True)
-            
-            if session_result:
-                session_id = session_result['id']
-                exit_time = datetime.now()
-                
-                # Update session with exit time
-                update_query = """
-                    UPDATE shobha_permanent_parking_sessions 
-                    SET exit_time = %s, duration_minutes = EXTRACT(EPOCH FROM (%s - entry_time))/60, updated_at = %s
-                    WHERE id = %s
-                """
-                success = self.db.execute_update(update_query, (exit_time, exit_time, exit_time, session_id))
-                
-                if success:
-                    logger.info(f"✅ EXIT: {plate_number} - Session updated")
-                    return True
-                else:
-                    logger.error(f"❌ EXIT: {plate_number} - Session update failed")
-                    return False
-            else:
-                logger.warning(f"❌ EXIT: {plate_number} - No active session found")
+        if self.motion_reference is not None and now - self.motion_reference_time < self.motion_recheck_interval:
+            if cv2.absdiff(small, self.motion_reference).mean() < self.motion_threshold:
                 return False
-                
-        except Exception as e:
-            logger.error(f"Exit session update error: {e}")
-            return False
-    
-    def determine_entry_or_exit(self, plate_number, vehicle_info):
-        """Determine if this is an entry or exit"""
-        if not self.db_available:
-            return len(self.detected_plates) % 2 == 0
         
-        try:
-            permanent_id = vehicle_info['id']
-            
-            # Check if there's an active session
-            query = """
-                SELECT COUNT(*) as active_count FROM shobha_permanent_parking_sessions 
-                WHERE permanent_parking_id = %s AND exit_time IS NULL
-            """
-            result = self.db.execute_query(query, (permanent_id,), fetch_one=True)
-            
-            if result and result['active_count'] > 0:
-                return False  # Has active session - this is an EXIT
-            else:
-                return True   # No active session - this is an ENTRY
-                
-        except Exception as e:
-            logger.error(f"Entry/Exit determination error: {e}")
-            return True
+        self.motion_reference = small
+        self.motion_reference_time = now
+        return True
     
-    def detection_loop(self):
-        """Main detection loop running in separate thread"""
-        self.running = True
-        
+    def capture_loop(self):
+        """Camera capture loop running in separate thread - the only reader of self.camera"""
         while self.running:
             try:
                 if self.camera and self.camera.isOpened():
                     ret, frame = self.camera.read()
                     if ret:
+                        # Encode once for all live feed viewers, ~10 fps and only while someone is watching
+                        now = time.monotonic()
+                        if self.live_viewers and now - self.last_live_frame_time >= self.live_frame_interval:
+                            self.last_live_frame_time = now
+                            self.publish_live_frame(frame)
+                        
+                        # Replace the detection slot - a busy detector skips stale frames
+                        with self.frame_condition:
+                            self.latest_frame = frame
+                            self.frame_id += 1
+                            self.frame_condition.notify_all()
+                    else:
+                        time.sleep(0.1)  # Frame read failed - don't spin
+                else:
+                    time.sleep(1)  # No camera - don't spin
+                
+                # No sleep on success - camera.read() blocks at the camera frame rate
+                
+            except Exception as e:
+                logger.error(f"Capture loop error: {e}")
+                time.sleep(1)
+        
+        # Release the camera from the thread that owns it
+        if self.camera:
+            self.camera.release()
+    
+    def detection_loop(self):
+        """Main detection loop running in separate thread - always works on the newest captured frame"""
+        last_frame_id = 0
+        
+        while self.running:
+            try:
+                # Detect plates every detection_interval seconds
+                wait = self.last_detection_time + self.detection_interval - time.time()
+                if wait > 0:
+                    time.sleep(min(wait, 1))
+                else:
+                    with self.frame_condition:
+                        self.frame_condition.wait_for(
+                            lambda: self.frame_id != last_frame_id or not self.running, timeout=1)
+                        frame_id, frame = self.frame_id, self.latest_frame
+                    
+                    if frame_id != last_frame_id:
+                        skipped = frame_id - last_frame_id - 1
+                        last_frame_id = frame_id
+                        if skipped > 0:
+                            logger.debug("Detection skipped %d stale frames", skipped)
+                        
                         current_time = time.time()
+                        seen_time = time.monotonic()
                         
-                        # Detect plates every detection_interval seconds
-                        if current_time - self.last_detection_time >= self.detection_interval:
-                            detected_plates, processed_frame = self.detect_license_plates(frame)
+                        # Skip detection while the scene is unchanged.
+                        # One BGR->GRAY conversion, shared by the motion gate and detection.
+                        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                        if self.has_motion(gray):
+                            detected_plates, processed_frame = self.detect_license_plates(frame, gray)
                             
                             # Debug: Log detection attempts
                             if len(detected_plates) > 0:
@@ -453,12 +563,13 @@ class ShobhaSmartANPRSystem:
                                 plate_text = plate['text']
                                 
                                 # Check if already detected recently
-                                if not any(p['text'] == plate_text and 
-                                         (current_time - p['timestamp'].timestamp()) < 10 
-                                         for p in self.detected_plates):
+                                existing = self.detected_plates.get(plate_text)
+                                if not (existing and (seen_time - existing[0]) < 10):
                                     
-                                    # Add to detected plates list
-                                    self.detected_plates.append(plate)
+                                    # Add to detected plates (re-detections move to the newest end)
+                                    with self.plates_lock:
+                                        self.detected_plates[plate_text] = (seen_time, plate)
+                                        self.detected_plates.move_to_end(plate_text)
                                     
                                     logger.info(f"📋 New plate detected: {plate_text}")
                                     
@@ -466,62 +577,68 @@ class ShobhaSmartANPRSystem:
                                     vehicle_info = self.check_shobha_database(plate_text)
                                     
                                     if vehicle_info:
-                                        # Vehicle is authorized - determine IN or OUT
-                                        is_entry = self.determine_entry_or_exit(plate_text, vehicle_info)
+                                        # Vehicle is authorized - record IN or OUT
+                                        is_entry = self.record_vehicle_movement(plate_text, vehicle_info)
                                         
-                                        # Update plate info with entry/exit status
-                                        plate['is_entry'] = is_entry
-                                        plate['vehicle_info'] = vehicle_info
+                                        # Update plate info with entry/exit status (None - shown as unknown - if not recorded)
+                                        with self.plates_lock:
+                                            plate['is_entry'] = is_entry
+                                            plate['vehicle_info'] = vehicle_info
                                         
-                                        if is_entry:
-                                            # Handle ENTRY
-                                            success = self.handle_vehicle_entry(plate_text, vehicle_info)
-                                            if success:
-                                                logger.info(f"🚪 ENTRY: {plate_text} - Barrier opening")
-                                            else:
-                                                logger.error(f"❌ ENTRY: {plate_text} - Session creation failed")
+                                        if is_entry is None:
+                                            logger.error(f"❌ {plate_text} - Entry/exit not recorded, barrier stays closed")
                                         else:
-                                            # Handle EXIT
-                                            success = self.handle_vehicle_exit(plate_text, vehicle_info)
-                                            if success:
-                                                logger.info(f"🚪 EXIT: {plate_text} - Barrier opening")
-                                            else:
-                                                logger.error(f"❌ EXIT: {plate_text} - Session update failed")
+                                            logger.info(f"🚪 {'ENTRY' if is_entry else 'EXIT'}: {plate_text} - Barrier opening")
                                     else:
                                         logger.info(f"❌ Unauthorized vehicle: {plate_text}")
-                                        plate['is_entry'] = None
+                                        with self.plates_lock:
+                                            plate['is_entry'] = None
                                 
                             self.last_detection_time = current_time
-                        
-                        # Keep only recent detections (last 30 seconds)
-                        self.detected_plates = [
-                            p for p in self.detected_plates 
-                            if (current_time - p['timestamp'].timestamp()) < 30
-                        ]
                 
-                time.sleep(0.1)  # Small delay to prevent high CPU usage
+                # Keep only recent detections (last 30 seconds) - oldest entries are at the front
+                seen_time = time.monotonic()
+                with self.plates_lock:
+                    while self.detected_plates:
+                        oldest_seen, _ = next(iter(self.detected_plates.values()))
+                        if (seen_time - oldest_seen) < 30:
+                            break
+                        self.detected_plates.popitem(last=False)
                 
             except Exception as e:
                 logger.error(f"Detection loop error: {e}")
                 time.sleep(1)
     
+    def stop(self):
+        """Stop the capture and detection loops and wait for the camera to be released"""
+        self.running = False
+        with self.frame_condition:
+            self.frame_condition.notify_all()
+        self.detection_thread.join(timeout=5)
+        self.capture_thread.join(timeout=5)
+    
+    def publish_live_frame(self, frame):
+        """Encode a camera frame as JPEG and hand it to waiting live feed viewers"""
+        # Resize frame for web display
+        frame = cv2.resize(frame, (640, 480))
+        
+        # Encode frame as JPEG
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        if ret:
+            with self.jpeg_condition:
+                self.latest_jpeg = buffer.tobytes()
+                self.jpeg_condition.notify_all()
+    
     def get_live_frame(self):
-        """Get live camera frame for streaming"""
-        if self.camera and self.camera.isOpened():
-            ret, frame = self.camera.read()
-            if ret:
-                # Resize frame for web display
-                frame = cv2.resize(frame, (640, 480))
-                
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if ret:
-                    return buffer.tobytes()
-        return None
+        """Get latest encoded camera frame for streaming, waiting briefly for a new one"""
+        with self.jpeg_condition:
+            self.jpeg_condition.wait(timeout=0.1)
+            return self.latest_jpeg
     
     def get_detected_plates(self):
-        """Get list of recently detected plates"""
-        return sorted(self.detected_plates, key=lambda x: x['timestamp'], reverse=True)
+        """Get a snapshot of recently detected plates, newest first"""
+        with self.plates_lock:
+            return [dict(plate) for _, plate in reversed(self.detected_plates.values())]
     
     def get_shobha_stats(self):
         """Get Shobha-specific statistics"""
@@ -538,23 +655,28 @@ class ShobhaSmartANPRSystem:
             }
         
         try:
-            # Get total permanent vehicles
-            total_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking"
-            total_result = self.db.execute_query(total_query, fetch_one=True)
-            total_vehicles = total_result['count'] if total_result else 0
-            
-            # Get vehicles currently IN (active sessions)
-            in_query = "SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions WHERE exit_time IS NULL"
-            in_result = self.db.execute_query(in_query, fetch_one=True)
-            vehicles_in = in_result['count'] if in_result else 0
-            
-            # Get vehicles OUT (completed sessions today)
-            out_query = """
-                SELECT COUNT(*) as count FROM shobha_permanent_parking_sessions 
-                WHERE exit_time IS NOT NULL AND DATE(exit_time) = CURRENT_DATE
-            """
-            out_result = self.db.execute_query(out_query, fetch_one=True)
-            vehicles_out = out_result['count'] if out_result else 0
+            current_time = time.time()
+            
+            # Reuse recent counts to absorb dashboard polling bursts
+            # Read the cache once - record_vehicle_movement clears it from the detection thread
+            result = self.stats_cache
+            if result is None or current_time - self.stats_cache_time >= self.stats_cache_ttl:
+                # Total vehicles, vehicles currently IN (active sessions) and
+                # vehicles OUT (completed sessions today) in one round-trip
+                stats_query = """
+                    SELECT
+                        (SELECT COUNT(*) FROM shobha_permanent_parking) AS total_vehicles,
+                        COUNT(*) FILTER (WHERE exit_time IS NULL) AS vehicles_in,
+                        COUNT(*) FILTER (WHERE exit_time IS NOT NULL AND DATE(exit_time) = CURRENT_DATE) AS vehicles_out
+                    FROM shobha_permanent_parking_sessions
+                """
+                result = self.db.execute_query(stats_query, fetch_one=True)
+                self.stats_cache_time = current_time
+                self.stats_cache = result
+            
+            total_vehicles = result['total_vehicles'] if result else 0
+            vehicles_in = result['vehicles_in'] if result else 0
+            vehicles_out = result['vehicles_out'] if result else 0
             
             return {
                 'total_vehicles': total_vehicles,
@@ -582,21 +704,32 @@ class ShobhaSmartANPRSystem:
 # Create global ANPR system instance
 anpr_system = ShobhaSmartANPRSystem()
 
+# The dashboard page has no template variables - render it once and reuse the bytes
+index_html = None
+
 @app.route('/')
 def index():
     """Main dashboard page"""
-    return render_template('shodha_dashboard.html')
+    global index_html
+    if index_html is None:
+        index_html = render_template('shodha_dashboard.html').encode('utf-8')
+    return Response(index_html, mimetype='text/html')
 
 @app.route('/api/live_feed')
 def live_feed():
     """Live camera feed endpoint"""
     def generate_frames():
-        while True:
-            frame = anpr_system.get_live_frame()
-            if frame:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.1)
+        with anpr_system.jpeg_condition:
+            anpr_system.live_viewers += 1
+        try:
+            while True:
+                frame = anpr_system.get_live_frame()
+                if frame:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        finally:
+            with anpr_system.jpeg_condition:
+                anpr_system.live_viewers -= 1
     
     return Response(generate_frames(),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
@@ -642,9 +775,7 @@ def main():
         app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     except KeyboardInterrupt:
         print("\n🛑 Shutting down...")
-        anpr_system.running = False
-        if anpr_system.camera:
-            anpr_system.camera.release()
+        anpr_system.stop()
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
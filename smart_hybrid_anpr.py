@@ -8,8 +8,9 @@ Only sends to API when potential plate is detected
 import cv2
 import numpy as np
 import requests
-import base64
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 
@@ -33,18 +34,36 @@ class SmartHybridANPR:
         self.max_plate_area = 100000
         self.min_aspect_ratio = 1.5
         self.max_aspect_ratio = 5.0
+        self.detection_scale = 0.5  # Region proposals run on a downscaled frame
+        
+        # Preprocessing objects reused on every frame
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        self.sharpen_kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+        self.morph_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+        
+        # OpenCL acceleration (e.g. Intel iGPU) for preprocessing, if present
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        cv2.ocl.setUseOpenCL(self.use_opencl)
         
         # API settings
         self.api_base_url = "https://api.platerecognizer.com/v1/plate-reader/"
         self.api_headers = {
             "Authorization": f"Token {self.api_key}"
         } if self.api_available else {}
+        self.api_max_width = 400  # Plate crops are downscaled to this width before upload
+        
+        # Keep-alive session - reuses the TLS connection across API calls
+        self.session = requests.Session()
+        self.session.headers.update(self.api_headers)
+        
+        # Candidate regions are sent to the API concurrently
+        self.api_pool = ThreadPoolExecutor(max_workers=4)
         
         # Detection history to avoid duplicates
-        self.recent_detections = []
+        self.recent_detections = OrderedDict()  # plate text -> {'bbox', 'timestamp'}, oldest first
         self.detection_cooldown = 10  # seconds
         
-        logger.info(f"🔧 Smart Hybrid ANPR initialized - API: {'✅ Available' if self.api_available else '❌ Not available'}")
+        logger.info(f"🔧 Smart Hybrid ANPR initialized - API: {'✅ Available' if self.api_available else '❌ Not available'}, OpenCL: {'✅' if self.use_opencl else '❌'}")
     
     def detect_potential_plates_opencv(self, image):
         """
@@ -52,12 +71,21 @@ class SmartHybridANPR:
         Only returns regions that look like number plates
         """
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            # Downscale - region proposals don't need full resolution
+            small = cv2.resize(image, (0, 0),
+                               fx=self.detection_scale, fy=self.detection_scale,
+                               interpolation=cv2.INTER_AREA)
+            scale = 1 / self.detection_scale
+            
+            # Run the filter stack through OpenCL (T-API) when a device is available
+            if self.use_opencl:
+                small = cv2.UMat(small)
+            
+            # Convert to grayscale (after the downscale - fewer pixels to convert)
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
             
             # Apply CLAHE for better contrast
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(gray)
+            enhanced = self.clahe.apply(small)
             
             # Apply bilateral filter
             filtered = cv2.bilateralFilter(enhanced, 11, 17, 17)
@@ -66,61 +94,63 @@ class SmartHybridANPR:
             blurred = cv2.GaussianBlur(filtered, (5, 5), 0)
             
             # Apply sharpening
-            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-            sharpened = cv2.filter2D(blurred, -1, kernel)
-            
-            # Multiple edge detection
-            edges1 = cv2.Canny(sharpened, 50, 150)
-            edges2 = cv2.Canny(sharpened, 100, 200)
-            edges3 = cv2.Canny(sharpened, 30, 100)
+            sharpened = cv2.filter2D(blurred, -1, self.sharpen_kernel)
             
-            # Combine edges
-            combined_edges = cv2.bitwise_or(edges1, edges2)
-            combined_edges = cv2.bitwise_or(combined_edges, edges3)
+            # Edge detection
+            # The union of Canny (50,150), (100,200) and (30,100) equals Canny (30,100):
+            # both thresholds are the lowest, so its hysteresis keeps every edge the others do
+            combined_edges = cv2.Canny(sharpened, 30, 100)
             
             # Morphological operations
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-            morphed = cv2.morphologyEx(combined_edges, cv2.MORPH_CLOSE, kernel)
+            morphed = cv2.morphologyEx(combined_edges, cv2.MORPH_CLOSE, self.morph_kernel)
+            if self.use_opencl:
+                morphed = morphed.get()  # findContours is CPU-only
             
             # Find contours
             contours, _ = cv2.findContours(morphed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
-            potential_plates = []
+            if not contours:
+                return []
             
-            for contour in contours:
-                area = cv2.contourArea(contour)
-                
-                # Filter by area
-                if self.min_plate_area < area < self.max_plate_area:
-                    x, y, w, h = cv2.boundingRect(contour)
-                    aspect_ratio = w / h
-                    
-                    # Filter by aspect ratio
-                    if self.min_aspect_ratio <= aspect_ratio <= self.max_aspect_ratio:
-                        # Calculate quality metrics
-                        hull = cv2.convexHull(contour)
-                        hull_area = cv2.contourArea(hull)
-                        solidity = area / hull_area if hull_area > 0 else 0
-                        
-                        rect_area = w * h
-                        extent = area / rect_area if rect_area > 0 else 0
-                        
-                        # Quality filter
-                        if solidity > 0.3 and extent > 0.2:
-                            potential_plates.append({
-                                'bbox': (x, y, w, h),
-                                'area': area,
-                                'aspect_ratio': aspect_ratio,
-                                'solidity': solidity,
-                                'extent': extent,
-                                'contour': contour
-                            })
-            
-            # Sort by quality (area * solidity * extent)
-            potential_plates.sort(key=lambda x: x['area'] * x['solidity'] * x['extent'], reverse=True)
-            
-            # Return top 3 candidates
-            return potential_plates[:3]
+            # Area and bbox for all contours, scaled back to full-resolution image coordinates
+            areas = np.array([cv2.contourArea(c) for c in contours]) * scale * scale
+            rects = (np.array([cv2.boundingRect(c) for c in contours]) * scale).astype(int)
+            aspect_ratios = rects[:, 2] / rects[:, 3]
+            
+            # Filter by area and aspect ratio in one pass
+            keep = np.flatnonzero(
+                (areas > self.min_plate_area) & (areas < self.max_plate_area) &
+                (aspect_ratios >= self.min_aspect_ratio) & (aspect_ratios <= self.max_aspect_ratio)
+            )
+            if keep.size == 0:
+                return []
+            
+            # Quality metrics, hulls only for the survivors
+            hull_areas = np.array([cv2.contourArea(cv2.convexHull(contours[i])) for i in keep]) * scale * scale
+            solidities = np.divide(areas[keep], hull_areas, out=np.zeros(keep.size), where=hull_areas > 0)
+            extents = areas[keep] / (rects[keep, 2] * rects[keep, 3])
+            
+            # Quality filter
+            good = (solidities > 0.3) & (extents > 0.2)
+            keep, solidities, extents = keep[good], solidities[good], extents[good]
+            
+            # Sort by quality (area * solidity * extent) and return top 3 candidates
+            scores = areas[keep] * solidities * extents
+            top = np.argsort(scores)[::-1][:3]
+            
+            potential_plates = []
+            for j in top:
+                i = keep[j]
+                x, y, w, h = (int(v) for v in rects[i])
+                potential_plates.append({
+                    'bbox': (x, y, w, h),
+                    'area': float(areas[i]),
+                    'aspect_ratio': float(aspect_ratios[i]),
+                    'solidity': float(solidities[j]),
+                    'extent': float(extents[j]),
+                    'contour': (contours[i] * scale).astype(np.int32)
+                })
+            return potential_plates
             
         except Exception as e:
             logger.error(f"OpenCV detection error: {e}")
@@ -141,21 +171,20 @@ class SmartHybridANPR:
             # Extract region from image
             plate_region = image[y:y+h, x:x+w]
             
-            # Convert to base64
-            _, buffer = cv2.imencode('.jpg', plate_region)
-            image_base64 = base64.b64encode(buffer).decode('utf-8')
-            
-            # Prepare request
-            data = {
-                'image': image_base64,
-                'regions': ['in'],  # Focus on Indian plates
-                'config': '{"region": {"type": "polygon", "vertices": [[0, 0], [image_width, 0], [image_width, image_height], [0, image_height]]}}'
-            }
+            # Upload raw JPEG bytes as multipart (no base64 inflation)
+            # Keep the upload small - plates OCR fine at 400px wide and JPEG quality 75
+            crop_h, crop_w = plate_region.shape[:2]
+            if crop_w > self.api_max_width:
+                plate_region = cv2.resize(plate_region, (self.api_max_width, int(crop_h * self.api_max_width / crop_w)),
+                                          interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', plate_region, [cv2.IMWRITE_JPEG_QUALITY, 75, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+            files = {'upload': ('plate.jpg', buffer.tobytes(), 'image/jpeg')}
+            data = {'regions': 'in'}  # Focus on Indian plates
             
             # Make API request
-            response = requests.post(
+            response = self.session.post(
                 self.api_base_url,
-                headers=self.api_headers,
+                files=files,
                 data=data,
                 timeout=5
             )
@@ -163,6 +192,7 @@ class SmartHybridANPR:
             if response.status_code == 200:
                 result = response.json()
                 plates = []
+                now = datetime.now()  # One timestamp for every plate in this response
                 
                 for detection in result.get('results', []):
                     plate_text = detection.get('plate', '').upper().strip()
@@ -172,7 +202,7 @@ class SmartHybridANPR:
                         plates.append({
                             'text': plate_text,
                             'confidence': confidence,
-                            'timestamp': datetime.now(),
+                            'timestamp': now,
                             'bbox': region['bbox'],
                             'source': 'api'
                         })
@@ -217,20 +247,18 @@ class SmartHybridANPR:
         """
         current_time = time.time()
         
-        # Clean up old detections
-        self.recent_detections = [
-            d for d in self.recent_detections 
-            if current_time - d['timestamp'] < self.detection_cooldown
-        ]
+        # Clean up old detections - oldest entries are at the front
+        while self.recent_detections:
+            oldest = next(iter(self.recent_detections.values()))
+            if current_time - oldest['timestamp'] < self.detection_cooldown:
+                break
+            self.recent_detections.popitem(last=False)
         
         # Check for duplicates
-        for detection in self.recent_detections:
-            if (detection['text'] == plate_text and 
-                abs(detection['bbox'][0] - bbox[0]) < 50 and
-                abs(detection['bbox'][1] - bbox[1]) < 50):
-                return True
-        
-        return False
+        detection = self.recent_detections.get(plate_text)
+        return bool(detection and
+                    abs(detection['bbox'][0] - bbox[0]) < 50 and
+                    abs(detection['bbox'][1] - bbox[1]) < 50)
     
     def detect_license_plates(self, image):
         """
@@ -255,38 +283,38 @@ class SmartHybridANPR:
             
             logger.info(f"🔍 Found {len(potential_plates)} potential plates")
             
+            # Step 2: Send all regions to API for accurate OCR in parallel
+            # (before drawing, so overlays don't end up in the uploaded crops)
+            futures = [self.api_pool.submit(self.send_to_api, image, region) for region in potential_plates]
+            region_results = [future.result() for future in futures]
+            
             detected_plates = []
+            region_labels = []  # best new plate per region, for the overlay
             
-            for region in potential_plates:
-                x, y, w, h = region['bbox']
-                
-                # Draw rectangle around potential plate
-                cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(image, "Potential Plate", (x, y - 10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                
-                # Step 2: Send to API for accurate OCR
-                api_results = self.send_to_api(image, region)
+            for region, api_results in zip(potential_plates, region_results):
+                label = None
                 
                 for plate in api_results:
                     # Check for duplicates
                     if not self.is_duplicate_detection(plate['text'], plate['bbox']):
                         detected_plates.append(plate)
                         
-                        # Add to recent detections
-                        self.recent_detections.append({
-                            'text': plate['text'],
+                        # Add to recent detections (re-detections move to the newest end)
+                        self.recent_detections[plate['text']] = {
                             'bbox': plate['bbox'],
                             'timestamp': current_time
-                        })
+                        }
+                        self.recent_detections.move_to_end(plate['text'])
                         
-                        # Draw final result
-                        cv2.putText(image, plate['text'], (x, y - 30), 
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                        cv2.putText(image, f"Conf: {plate['confidence']:.2f}", (x, y - 50), 
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                        if label is None or plate['confidence'] > label['confidence']:
+                            label = plate
                         
                         logger.info(f"✅ Plate detected: {plate['text']} (confidence: {plate['confidence']:.2f})")
+                
+                region_labels.append(label)
+            
+            # Step 3: Draw the overlay in one pass from the results above
+            self.draw_results(image, potential_plates, region_labels)
             
             return detected_plates, image
             
@@ -294,6 +322,23 @@ class SmartHybridANPR:
             logger.error(f"Detection error: {e}")
             return [], image
     
+    def draw_results(self, image, regions, labels):
+        """Draw each candidate region with its best newly detected plate, if any"""
+        for region, plate in zip(regions, labels):
+            x, y, w, h = region['bbox']
+            
+            # Draw rectangle around potential plate
+            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(image, "Potential Plate", (x, y - 10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            
+            if plate:
+                # Draw final result
+                cv2.putText(image, plate['text'], (x, y - 30), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                cv2.putText(image, f"Conf: {plate['confidence']:.2f}", (x, y - 50), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    
     def get_api_usage_stats(self):
         """Get API usage statistics"""
         return {
@@ -317,6 +362,12 @@ def test_smart_hybrid_anpr():
         print("❌ Could not open camera")
         return
     
+    # Compressed 640x480 frames with no driver backlog keep the preview current
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    
     print("✅ Camera opened")
     print("📋 Show a number plate to the camera")
     print("⏹️ Press 'q' to quit")
@@ -7,56 +7,54 @@ Smart hybrid detection - OpenCV for initial detection, API for accurate OCR
 import sys
 import os
 import time
-from shobha_smart_dashboard import main
+from importlib.util import find_spec
 
 def check_requirements():
     """Check if all requirements are met"""
     print("🔍 Checking System Requirements...")
     print("=" * 50)
     
-    # Check OpenCV
-    try:
-        import cv2
+    # Check OpenCV (presence only - the dashboard imports it when it starts)
+    if find_spec('cv2'):
         print("✅ OpenCV installed")
-    except ImportError:
+    else:
         print("❌ OpenCV not installed")
         print("💡 Install with: pip install opencv-python")
         return False
     
     # Check Flask
-    try:
-        import flask
+    if find_spec('flask'):
         print("✅ Flask installed")
-    except ImportError:
+    else:
         print("❌ Flask not installed")
         print("💡 Install with: pip install flask")
         return False
     
     # Check requests (for API)
-    try:
-        import requests
+    if find_spec('requests'):
         print("✅ Requests installed")
-    except ImportError:
+    else:
         print("❌ Requests not installed")
         print("💡 Install with: pip install requests")
         return False
     
-    # Check camera
-    try:
-        cap = cv2.VideoCapture(0)
-        if cap.isOpened():
-            print("✅ Camera detected")
-            cap.release()
-        else:
-            print("⚠️ Camera not detected - system will run in demo mode")
-    except Exception as e:
-        print(f"⚠️ Camera check failed: {e}")
+    # Check camera (slow - opening the device enumerates cameras), only with --probe-camera
+    if '--probe-camera' in sys.argv:
+        try:
+            import cv2
+            cap = cv2.VideoCapture(0)
+            if cap.isOpened():
+                print("✅ Camera detected")
+                cap.release()
+            else:
+                print("⚠️ Camera not detected - system will run in demo mode")
+        except Exception as e:
+            print(f"⚠️ Camera check failed: {e}")
     
-    # Check database (optional)
-    try:
-        from secure_database_connection import secure_db
-        print("✅ Database connection available")
-    except ImportError:
+    # Check database (optional) - the dashboard connects when it starts
+    if find_spec('psycopg2') and find_spec('secure_database_connection'):
+        print("✅ Database module available")
+    else:
         print("⚠️ Database not available - running in demo mode")
     
     # Check API key
@@ -97,7 +95,8 @@ def main_startup():
     print("=" * 50)
     
     try:
-        # Start the system
+        # Start the system - importing the dashboard opens the camera and database
+        from shobha_smart_dashboard import main
         main()
     except KeyboardInterrupt:
         print("\n🛑 Smart ANPR System stopped by user")